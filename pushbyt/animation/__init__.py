@@ -1,5 +1,14 @@
 from .util import render, FRAME_TIME
 from .generate import generate, update_timer
 from .radar import clock_radar
+from .fonts import get_font, preload_fonts
 
-__all__ = ["render", "FRAME_TIME", "generate", "update_timer", "clock_radar"]
+__all__ = [
+    "render",
+    "FRAME_TIME",
+    "generate",
+    "update_timer",
+    "clock_radar",
+    "get_font",
+    "preload_fonts",
+]
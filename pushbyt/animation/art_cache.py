@@ -0,0 +1,43 @@
+import os
+from typing import Optional, Tuple
+from PIL import Image, PngImagePlugin
+from pushbyt.animation.disk_cache import DiskCache
+
+Color = Tuple[int, int, int]
+
+
+class ArtCache(DiskCache):
+    """
+    Decoded album art and its dominant color on disk, keyed by URL.
+
+    Each entry is a PNG with the color stored in a text chunk, so a hit is a
+    single small file read with no network and no rescanning of the art.
+    """
+
+    name = "art cache"
+    suffix = ".png"
+    max_files = 500
+
+    def fetch(self, url: str) -> Optional[Tuple[Image.Image, Color]]:
+        path = self.path(url)
+        try:
+            with Image.open(path) as image:
+                image.load()
+                color = tuple(int(c) for c in image.text["dominant_color"].split(","))
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image, color
+
+    def store(self, url: str, art: Image.Image, color: Color):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(url)
+        info = PngImagePlugin.PngInfo()
+        info.add_text("dominant_color", ",".join(str(c) for c in color))
+        info.add_text("url", url)
+        temp = path.with_name(f".{path.name}.tmp")
+        art.save(temp, "PNG", pnginfo=info)
+        os.replace(temp, path)
+        self.evict()
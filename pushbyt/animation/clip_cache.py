@@ -0,0 +1,51 @@
+import os
+import shutil
+from pathlib import Path
+from pushbyt.animation.disk_cache import DiskCache
+
+
+class ClipCache(DiskCache):
+    """
+    Encoded clips kept on disk and addressed by what's in them.
+
+    The key describes everything the clip's bytes depend on, so any clip
+    with the same key can be reused as is. Clips are hard linked in and out
+    of the cache, which costs no copying and means evicting an entry never
+    touches a file an Animation still points at.
+    """
+
+    name = "clip cache"
+    suffix = ".webp"
+    max_files = 2000
+
+    def fetch(self, key: str, file_path) -> bool:
+        """Put the cached clip for key at file_path, if there is one."""
+        cached = self.path(key)
+        try:
+            link(cached, Path(file_path))
+            os.utime(cached)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key: str, file_path):
+        """Add a freshly rendered clip to the cache."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        link(Path(file_path), self.path(key))
+        self.evict()
+
+
+def link(source: Path, destination: Path):
+    """Atomically make destination the same file as source."""
+    temp = destination.with_name(f".{destination.name}.tmp")
+    temp.unlink(missing_ok=True)
+    try:
+        os.link(source, temp)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Hard links aren't supported everywhere (e.g. across filesystems)
+        shutil.copyfile(source, temp)
+    os.replace(temp, destination)
@@ -0,0 +1,73 @@
+import hashlib
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+
+class CacheStats:
+    """Hit and miss counters for a cache, reported under `name`."""
+
+    name = "cache"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        return f"{self.name} {self.hits}/{total} hits ({self.hit_rate:.0%})"
+
+
+class DiskCache(CacheStats):
+    """
+    Files in a directory, named by a hash of their key.
+
+    Entries are evicted least recently used first, going by mtime, once
+    there are more than `max_files` or once they haven't been used for
+    `max_age`. Subclasses touch an entry when they fetch it and call evict()
+    after storing one.
+    """
+
+    suffix = ""
+    max_files = 1000
+
+    def __init__(
+        self,
+        directory,
+        max_files: Optional[int] = None,
+        max_age: Optional[timedelta] = None,
+    ):
+        super().__init__()
+        self.directory = Path(directory)
+        if max_files is not None:
+            self.max_files = max_files
+        self.max_age = max_age
+
+    def path(self, key: str) -> Path:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return self.directory / f"{digest}{self.suffix}"
+
+    def evict(self):
+        paths = list(self.directory.glob(f"*{self.suffix}"))
+        if len(paths) <= self.max_files and not self.max_age:
+            return
+        entries = []
+        for path in paths:
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Evicted by another process since the glob
+                continue
+        entries.sort()
+        expired = max(0, len(entries) - self.max_files)
+        if self.max_age:
+            cutoff = time.time() - self.max_age.total_seconds()
+            expired = max(expired, sum(mtime < cutoff for mtime, _ in entries))
+        for _, entry in entries[:expired]:
+            entry.unlink(missing_ok=True)
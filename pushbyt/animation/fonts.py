@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from PIL import ImageFont
+from pushbyt.animation.text import GlyphAtlas
+
+logger = logging.getLogger(__name__)
+
+# (path, size) of every font the animations draw with
+PIXELMIX = ("fonts/pixelmix/pixelmix.ttf", 8)
+UPHEAVAL = ("fonts/upheaval/upheavtt.ttf", 20)
+DEPARTURE_MONO = ("fonts/DepartureMono/DepartureMono-Regular.ttf", 22)
+PIXEL12X10 = ("fonts/pixel12x10/Pixel12x10-v1.1.0.ttf", 16)
+
+ALL_FONTS = [PIXELMIX, UPHEAVAL, DEPARTURE_MONO, PIXEL12X10]
+
+
+class FontRegistry:
+    """
+    Fonts and their glyph atlases, built once per process and shared by every
+    generator.
+
+    Preloading before gunicorn forks its workers lets them all share the
+    loaded fonts copy-on-write. `loads` and `load_time` show whether anything
+    is still being loaded from disk on the render path.
+    """
+
+    def __init__(self):
+        self.fonts: dict[tuple[str, int], ImageFont.FreeTypeFont] = {}
+        self.atlases: dict[tuple[str, int], GlyphAtlas] = {}
+        self.loads = 0
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        key = (str(Path(path)), size)
+        font = self.fonts.get(key)
+        if font is not None:
+            return font
+        with self.lock:
+            font = self.fonts.get(key)
+            if font is None:
+                start = time.perf_counter()
+                font = ImageFont.truetype(key[0], size)
+                self.load_time += time.perf_counter() - start
+                self.loads += 1
+                self.fonts[key] = font
+        return font
+
+    def get_atlas(self, path: str, size: int) -> GlyphAtlas:
+        key = (str(Path(path)), size)
+        atlas = self.atlases.get(key)
+        if atlas is None:
+            font = self.get(path, size)
+            with self.lock:
+                atlas = self.atlases.get(key)
+                if atlas is None:
+                    start = time.perf_counter()
+                    atlas = GlyphAtlas(font)
+                    self.load_time += time.perf_counter() - start
+                    self.atlases[key] = atlas
+        return atlas
+
+    def preload(self, fonts=ALL_FONTS):
+        for path, size in fonts:
+            self.get_atlas(path, size)
+        logger.info(f"Preloaded {self}")
+
+    def __str__(self):
+        return f"{self.loads} fonts loaded in {self.load_time * 1000:.1f}ms"
+
+
+registry = FontRegistry()
+
+
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return registry.get(path, size)
+
+
+def get_atlas(path: str, size: int) -> GlyphAtlas:
+    return registry.get_atlas(path, size)
+
+
+def preload_fonts():
+    registry.preload()
@@ -1,17 +1,27 @@
 import os
 import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime, timedelta
-from pushbyt.animation.rays2 import clock_rays
-from pushbyt.animation.radar import clock_radar
+from pushbyt.animation import radar, rays2
 from pushbyt.animation.song import song_info
+from pushbyt.animation.song import RENDER_VERSION as SONG_VERSION
 from pushbyt.animation.timer import timer as timer_frames
+from pushbyt.animation.timer import RENDER_VERSION as TIMER_VERSION
 from pathlib import Path
+from typing import Optional
 from django.db.models import Max
-from django.db import utils as django_db_utils
+from django.db import connections, utils as django_db_utils
 from django.utils import timezone
 from pushbyt.models import Animation
 from pushbyt.spotify import now_playing
 from pushbyt.animation import render, FRAME_TIME
+from pushbyt.animation import util
+from pushbyt.animation.util import FrameCache, render_all
+from pushbyt.animation.clip_cache import ClipCache
+from pushbyt.animation.fonts import registry as font_registry
+from pushbyt.animation.fonts import get_atlas, DEPARTURE_MONO
 from ha.models import Timer
 import logging
 
@@ -20,34 +30,82 @@ ANIM_DURATION = timedelta(seconds=15)
 ANIM_STEP = timedelta(seconds=12)  # Start a new animation every 12 seconds
 FRAME_COUNT = ANIM_DURATION // FRAME_TIME
 RENDER_DIR = Path("render")
+# Timer clips only depend on the time remaining, so they're kept across
+# segments and restarts. The cleanup job leaves render/cache alone.
+TIMER_CLIPS = ClipCache(RENDER_DIR / "cache" / "timer")
+# Finished Spotify renders, so a track that comes back isn't rendered again
+SPOTIFY_RENDERS = ClipCache(
+    RENDER_DIR / "cache" / "spotify", max_files=500, max_age=timedelta(days=30)
+)
+# How long each check is expected to take. An overrun is only reported: the
+# hard limits are the timeouts on the Spotify and album art requests.
+SPOTIFY_BUDGET = timedelta(seconds=20)
+RENDER_BUDGET = timedelta(seconds=50)
 
 
 logger = logging.getLogger(__name__)
 
 
 def generate():
+    """
+    Run every check and report what each one did.
+
+    This blocks until all the checks have finished, however long that takes,
+    so the caller's lock covers everything they write. A check that runs past
+    its budget is logged and reported, not abandoned.
+    """
     os.makedirs(RENDER_DIR, exist_ok=True)
     now = timezone.now().astimezone(timezone.get_current_timezone())
     logger.info(f"now {now}")
     aligned_time = Animation.align_time(now)
     logger.info(f"aligned {aligned_time}")
     # Run each check independently so a failure in one (e.g. Spotify auth)
-    # doesn't prevent clock/timer animations from being generated.
-    results = [
-        run_check(check_spotify),
-        run_check(check_timer, aligned_time),
-        run_check(generate_clock, aligned_time),
+    # doesn't prevent clock/timer animations from being generated. They share
+    # no state, so they also run concurrently: a slow Spotify request doesn't
+    # hold up clock coverage.
+    checks = [
+        (check_spotify, (), SPOTIFY_BUDGET),
+        (check_timer, (aligned_time,), RENDER_BUDGET),
+        (generate_clock, (aligned_time,), RENDER_BUDGET),
     ]
+    start = time.monotonic()
+    with ThreadPoolExecutor(len(checks), thread_name_prefix="generate") as executor:
+        futures = [
+            (check, executor.submit(run_threaded_check, check, *args), budget)
+            for check, args, budget in checks
+        ]
+        results = []
+        for check, future, budget in futures:
+            remaining = start + budget.total_seconds() - time.monotonic()
+            try:
+                results.append(future.result(timeout=max(0, remaining)))
+            except TimeoutError:
+                logger.error(f"{check.__name__} is taking longer than {budget}")
+                results.append(
+                    f"{check.__name__} took longer than {budget}: {future.result()}"
+                )
+    logger.info(f"Font registry: {font_registry}")
     return "\n".join(results)
 
 
+def run_threaded_check(check, *args):
+    """Run a check on a pool thread, closing the thread's own DB connection."""
+    try:
+        return run_check(check, *args)
+    finally:
+        connections.close_all()
+
+
 def run_check(check, *args):
     """Run a generation check, logging any failure without crashing the request."""
+    start = time.perf_counter()
     try:
         return check(*args)
     except Exception:
         logger.exception(f"{check.__name__} failed")
         return f"{check.__name__} failed"
+    finally:
+        logger.info(f"{check.__name__} took {time.perf_counter() - start:.2f}s")
 
 
 def check_spotify():
@@ -68,14 +126,31 @@ def check_spotify():
     except Animation.DoesNotExist:
         pass
 
-    frames = [*song_info(track_title, track_info["artist"], track_info["art"])]
-    file_path = (Path("render") / f"spotify-{track_id}").with_suffix(".webp")
-    render(frames, file_path)
+    file_path = (RENDER_DIR / f"spotify-{track_id}").with_suffix(".webp")
+    key = spotify_render_key(track_info)
+    reused = SPOTIFY_RENDERS.fetch(key, file_path)
+    if not reused:
+        frames = [*song_info(track_title, track_info["artist"], track_info["art"])]
+        # The file may be a link into the render cache from an earlier play
+        file_path.unlink(missing_ok=True)
+        if render(frames, file_path):
+            SPOTIFY_RENDERS.store(key, file_path)
     anim = Animation(
-        file_path=file_path, source=Animation.Source.SPOTIFY, metadata={"id": track_id}
+        file_path=file_path,
+        source=Animation.Source.SPOTIFY,
+        metadata={"id": track_id, "reused": reused},
     )
     anim.save()
-    return f"Spotify now playing {track_title}"
+    logger.info(f"Spotify {SPOTIFY_RENDERS}")
+    verb = "reused" if reused else "rendered"
+    return f"Spotify now playing {track_title} ({verb}, {SPOTIFY_RENDERS})"
+
+
+def spotify_render_key(track_info) -> str:
+    return (
+        f"spotify v{SONG_VERSION} {track_info['id']} {track_info['title']}"
+        + f" {track_info['artist']} {track_info['art']} {util.encoding_key()}"
+    )
 
 
 SEGMENT_TIME = timedelta(seconds=90)
@@ -102,31 +177,22 @@ def check_timer(start_time):
 
 
 def generate_timer_frames(start_time, timer, duration):
-    """Generate a continuous sequence of timer frames."""
+    """Generate a continuous stream of (frame, time) timer frames."""
     t = start_time
     end_time = t + duration
 
     # Calculate the time remaining from the start of our sequence
     time_remaining_at_start = timer.created_at + timer.duration - t
 
-    # Generate all frames
-    all_frames = []
-    all_times = []
-
     # Create a new generator that starts from our specific time point
     frames = timer_frames(time_remaining_at_start)
 
-    while t < end_time:
-        try:
-            frame = next(frames)
-            all_frames.append(frame)
-            all_times.append(t)
-            t += FRAME_TIME
-        except StopIteration:
-            # Timer might end during the sequence
+    # The timer might end during the sequence
+    for frame in frames:
+        if t >= end_time:
             break
-
-    return all_frames, all_times
+        yield frame, t
+        t += FRAME_TIME
 
 
 def generate_timer(start_time, timer):
@@ -141,46 +207,58 @@ def generate_timer(start_time, timer):
 
     # Generate frames for full segment plus buffer
     duration = SEGMENT_TIME + ANIM_DURATION
-    all_frames, all_times = generate_timer_frames(segment_start, timer, duration)
-
-    # No frames were generated (timer might be too short)
-    if not all_frames:
-        return "No timer frames generated"
-
-    animations = []
-    frames_per_anim = int(ANIM_DURATION.total_seconds() / FRAME_TIME.total_seconds())
-    frames_per_step = int(ANIM_STEP.total_seconds() / FRAME_TIME.total_seconds())
+    timed_frames = generate_timer_frames(segment_start, timer, duration)
+    # Overlapping animations share frames, so encode each one only once
+    cache = FrameCache()
 
-    # Make sure we have enough frames for a complete animation
-    max_start_idx = len(all_frames) - frames_per_anim
+    reused = []
+    pending = []
 
-    for i in range(0, max_start_idx + 1, frames_per_step):
-        anim_frames = all_frames[i : i + frames_per_anim]
-        anim_start_time = all_times[i]
-
-        # Check if this timer is approaching completion (important)
-        important = timer.created_at + timer.duration - anim_start_time < timedelta(
-            seconds=90
-        )
+    def clips():
+        for anim_start_time, anim_frames in iter_windows(timed_frames):
+            # Check if this timer is approaching completion (important)
+            time_left = timer.created_at + timer.duration - anim_start_time
+            important = time_left < timedelta(seconds=90)
 
-        file_path = (
-            Path("render") / ("timer_" + anim_start_time.strftime("%j-%H-%M-%S"))
-        ).with_suffix(".webp")
+            file_path = (
+                RENDER_DIR / ("timer_" + anim_start_time.strftime("%j-%H-%M-%S"))
+            ).with_suffix(".webp")
 
-        if render(anim_frames, file_path):
-            animations.append(
-                Animation(
-                    file_path=file_path,
-                    start_time=anim_start_time,
-                    source=Animation.Source.TIMER,
-                    metadata={"id": timer.pk, "important": important},
-                )
+            animation = Animation(
+                file_path=file_path,
+                start_time=anim_start_time,
+                source=Animation.Source.TIMER,
+                metadata={"id": timer.pk, "important": important},
             )
+            key = timer_clip_key(time_left, len(anim_frames))
+            if TIMER_CLIPS.fetch(key, file_path):
+                reused.append(animation)
+                continue
+            # The file may be a link into the clip cache from an earlier run
+            file_path.unlink(missing_ok=True)
+            pending.append((animation, key))
+            yield anim_frames, file_path
+
+    # Only keep the animations that actually rendered
+    rendered = render_all(clips(), cache=cache)
+    animations = list(reused)
+    for (animation, key), ok in zip(pending, rendered):
+        if ok:
+            TIMER_CLIPS.store(key, animation.file_path)
+            animations.append(animation)
+    animations.sort(key=lambda anim: anim.start_time)
+
+    # No animations were rendered (timer might be too short)
+    if not animations:
+        return "No timer frames generated"
 
+    logger.info(f"Timer {cache}, {TIMER_CLIPS}")
     try:
         new_anims = Animation.objects.bulk_create(animations)
-        return f"Created {len(new_anims)} timers starting at " + segment_start.strftime(
-            " %-I:%M:%S"
+        return (
+            f"Created {len(new_anims)} timers starting at "
+            + segment_start.strftime(" %-I:%M:%S")
+            + f" ({len(reused)} reused, {cache}, {TIMER_CLIPS})"
         )
     except django_db_utils.IntegrityError as e:
         # Log the error but don't crash
@@ -190,6 +268,44 @@ def generate_timer(start_time, timer):
         return "Partial creation of timer animations - some already existed"
 
 
+def timer_clip_key(time_left: timedelta, frame_count: int) -> str:
+    """
+    Everything a timer clip's bytes depend on.
+
+    Timer frames only depend on the time left, and only to the tenth of a
+    second, except that a clip starting exactly on a tenth hits zero on a
+    frame of its own. The renderer version and encoder settings that change
+    the bytes are included.
+    """
+    tenths, remainder = divmod(time_left, FRAME_TIME)
+    exact = "exact" if not remainder else "offset"
+    return (
+        f"timer v{TIMER_VERSION} {tenths} {exact} {frame_count} frames"
+        + f" {util.encoding_key()}"
+    )
+
+
+def iter_windows(timed_frames, anim_duration=ANIM_DURATION, step=ANIM_STEP):
+    """
+    Yield (start_time, frames) for each overlapping animation window.
+
+    Frames are pulled from the (frame, time) stream into a ring buffer that
+    holds a single window, and each window is emitted as soon as it's
+    complete, so memory doesn't grow with the length of the segment.
+    """
+    frames_per_anim = int(anim_duration.total_seconds() / FRAME_TIME.total_seconds())
+    frames_per_step = int(step.total_seconds() / FRAME_TIME.total_seconds())
+
+    window = deque(maxlen=frames_per_anim)
+    times = deque(maxlen=frames_per_anim)
+    for i, (frame, t) in enumerate(timed_frames):
+        window.append(frame)
+        times.append(t)
+        start_idx = i + 1 - frames_per_anim
+        if start_idx >= 0 and start_idx % frames_per_step == 0:
+            yield times[0], list(window)
+
+
 def get_segment_start(start_time, *sources):
     """
     Determine the appropriate start time for a new animation segment based on existing coverage.
@@ -267,59 +383,97 @@ def get_segment_start(start_time, *sources):
 CLOCK_SOURCES = [Animation.Source.RAYS, Animation.Source.RADAR]
 
 
-def generate_clock_frames(start_time: datetime, duration: timedelta, source):
-    """Generate a continuous sequence of clock frames."""
-    t = start_time
-    end_time = t + duration
+def segment_seed(segment_start: datetime) -> int:
+    """
+    Seed for everything random in a segment, so re-rendering it is exact.
+
+    A segment that resumed from the one before also depends on the renderer
+    state it restored, so reproducing it takes the snapshot in the clip
+    named by its "resumed_from" metadata as well as the seed.
+    """
+    return int(segment_start.timestamp() * 1000)
 
-    # Choose the appropriate animation generator based on the selected source
-    frames_generator = (
-        clock_radar(t) if source == Animation.Source.RADAR else clock_rays()
-    )
 
-    # Start the generator
-    next(frames_generator)
+def clock_renderer(source, start_time: datetime, rng: random.Random):
+    """A fresh renderer for the source, with the frame-by-frame state."""
+    if source == Animation.Source.RADAR:
+        return radar.Renderer(get_atlas(*DEPARTURE_MONO), start_time, rng)
+    return rays2.Renderer(rng)
+
+
+def generate_clock_frames(
+    start_time: datetime, duration: timedelta, renderer, snapshots=None
+):
+    """
+    Generate a continuous stream of (frame, time) clock frames.
+
+    For each time that's a key of `snapshots`, the renderer's state just
+    before drawing that frame is stored under it.
+    """
+    t = start_time
+    end_time = t + duration
 
-    # Generate all frames
-    all_frames = []
-    all_times = []
     while t < end_time:
-        all_frames.append(frames_generator.send(t))
-        all_times.append(t)
+        if snapshots is not None and t in snapshots:
+            snapshots[t] = renderer.snapshot()
+        yield renderer.render_frame(t), t
         t += FRAME_TIME
 
-    return all_frames, all_times
 
+def next_segment_start(segment_start: datetime, duration: timedelta) -> datetime:
+    """Where the segment after one of `duration` picks up: a step after its last clip."""
+    anim_count = (duration - ANIM_DURATION) // ANIM_STEP + 1
+    return segment_start + anim_count * ANIM_STEP
 
-def slice_into_animations(
-    all_frames, all_times, source, anim_duration=ANIM_DURATION, step=ANIM_STEP
-):
-    """Slice frames into overlapping animations."""
-    frames_per_anim = int(anim_duration.total_seconds() / FRAME_TIME.total_seconds())
-    frames_per_step = int(step.total_seconds() / FRAME_TIME.total_seconds())
 
-    animations = []
-    # Make sure we have enough frames for a complete animation
-    max_start_idx = len(all_frames) - frames_per_anim
+def resume_renderer(renderer, source, segment_start: datetime) -> Optional[int]:
+    """
+    Restore the renderer from the snapshot left by the segment before, if any.
 
-    for i in range(0, max_start_idx + 1, frames_per_step):
-        anim_frames = all_frames[i : i + frames_per_anim]
-        anim_start_time = all_times[i]
+    Returns the pk of the Animation holding the snapshot it resumed from.
+    """
+    previous = Animation.objects.filter(
+        source=source, start_time=segment_start - ANIM_STEP
+    ).first()
+    snapshot = previous.metadata.get("snapshot") if previous else None
+    if not snapshot or datetime.fromisoformat(snapshot["time"]) != segment_start:
+        return None
+    renderer.restore(snapshot["state"])
+    return previous.pk
 
-        file_path = (
-            Path("render") / (f"{source}_" + anim_start_time.strftime("%j-%H-%M-%S"))
-        ).with_suffix(".webp")
 
-        render(anim_frames, file_path)
+def slice_into_animations(
+    timed_frames,
+    source,
+    anim_duration=ANIM_DURATION,
+    step=ANIM_STEP,
+    cache=None,
+    metadata=None,
+):
+    """Slice a stream of (frame, time) pairs into overlapping animations."""
+    cache = cache or FrameCache()
+    animations = []
 
-        animations.append(
-            Animation(
-                file_path=file_path,
-                start_time=anim_start_time,
-                source=source,
+    def clips():
+        for anim_start_time, anim_frames in iter_windows(
+            timed_frames, anim_duration, step
+        ):
+            file_path = (
+                RENDER_DIR / (f"{source}_" + anim_start_time.strftime("%j-%H-%M-%S"))
+            ).with_suffix(".webp")
+
+            animations.append(
+                Animation(
+                    file_path=file_path,
+                    start_time=anim_start_time,
+                    source=source,
+                    metadata=dict(metadata or {}),
+                )
             )
-        )
+            yield anim_frames, file_path
 
+    # Encode every slice before any of them are saved
+    render_all(clips(), cache=cache)
     return animations
 
 
@@ -329,8 +483,13 @@ def generate_clock(start_time: datetime):
         logger.info("Clock animations: Sufficient future coverage exists")
         return "Already have clock"
 
-    # Randomly choose between rays or radar
-    source = random.choice(CLOCK_SOURCES)
+    # Randomly choose between rays or radar, the same way on every re-render.
+    # The choice ignores which source left a snapshot, so about half of all
+    # segment boundaries switch source and start from a fresh renderer.
+    # Keeping the variety is worth more than the continuity.
+    seed = segment_seed(segment_start)
+    rng = random.Random(seed)
+    source = rng.choice(CLOCK_SOURCES)
     logger.info(
         f"Generating {source.value} animations starting at {segment_start.strftime('%-I:%M:%S')}"
     )
@@ -338,10 +497,28 @@ def generate_clock(start_time: datetime):
     # Generate frames for 90 seconds plus buffer to ensure we have enough frames
     # for the last complete animation
     duration = SEGMENT_TIME + ANIM_DURATION
-    all_frames, all_times = generate_clock_frames(segment_start, duration, source)
+    renderer = clock_renderer(source, segment_start, rng)
+    resumed_from = resume_renderer(renderer, source, segment_start)
+    metadata = {"seed": seed}
+    if resumed_from is not None:
+        metadata["resumed_from"] = resumed_from
+    # The next segment carries on from where this one's clips end
+    next_start = next_segment_start(segment_start, duration)
+    snapshots = {next_start: None}
+    timed_frames = generate_clock_frames(segment_start, duration, renderer, snapshots)
 
     # Slice into overlapping animations
-    animations = slice_into_animations(all_frames, all_times, source)
+    cache = FrameCache()
+    animations = slice_into_animations(
+        timed_frames, source, cache=cache, metadata=metadata
+    )
+    if animations and snapshots[next_start]:
+        animations[-1].metadata["snapshot"] = {
+            "time": next_start.isoformat(),
+            "state": snapshots[next_start],
+        }
+    continuity = "fresh" if resumed_from is None else "resumed"
+    logger.info(f"{source.value} {cache}, {continuity}")
 
     # Save to database - handle potential uniqueness constraint errors
     try:
@@ -349,6 +526,7 @@ def generate_clock(start_time: datetime):
         return (
             f"Created {len(new_anims)} {source} starting at "
             + segment_start.strftime(" %-I:%M:%S")
+            + f" ({cache}, {continuity})"
         )
     except django_db_utils.IntegrityError as e:
         # Log the error but don't crash
@@ -1,11 +1,13 @@
 import math
 import random
-from dataclasses import dataclass
-from typing import Tuple, Generator
-from collections import defaultdict
+from typing import Generator, Optional
+from functools import lru_cache
 
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageDraw
 from datetime import datetime, timedelta
+from pushbyt.animation.fonts import get_atlas, DEPARTURE_MONO
+from pushbyt.animation.snapshot import pack_array, unpack_array
 
 
 WIDTH, HEIGHT = 64, 32
@@ -13,48 +15,65 @@ SCALE_FACTOR = 4
 SCALED_WIDTH, SCALED_HEIGHT = SCALE_FACTOR * WIDTH, SCALE_FACTOR * HEIGHT
 
 
-def clock_radar(start_time: datetime) -> Generator[Image.Image, datetime, None]:
-    font = ImageFont.truetype("./fonts/DepartureMono/DepartureMono-Regular.ttf", 22)
-    renderer = Renderer(font, start_time)
+def distance_field(width, height):
+    """Distance of each pixel from the center, normalized to 1 at the corners."""
+    center_x, center_y = width // 2, height // 2
+    y, x = np.mgrid[0:height, 0:width]
+    distance = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+    return distance / math.sqrt(center_x**2 + center_y**2)
+
+
+def radial_order(width, height):
+    """Flat pixel indices sorted by distance from the center, then by x and y."""
+    center_x, center_y = width // 2, height // 2
+    y, x = np.mgrid[0:height, 0:width]
+    distance = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+    return np.lexsort((y.ravel(), x.ravel(), distance.ravel()))
+
+
+NORMALIZED_DISTANCE = distance_field(WIDTH, HEIGHT)[..., np.newaxis]
+RADIAL_ORDER = radial_order(WIDTH, HEIGHT)
+
+
+def clock_radar(
+    start_time: datetime, rng: Optional[random.Random] = None
+) -> Generator[Image.Image, datetime, None]:
+    atlas = get_atlas(*DEPARTURE_MONO)
+    renderer = Renderer(atlas, start_time, rng)
     next_frame = Image.new("RGB", (WIDTH, HEIGHT), color="black")
     while True:
         t = yield next_frame
         next_frame = renderer.render_frame(t)
 
 
-def compose_time_img(font, t: datetime) -> Image.Image:
-    hours_text = t.strftime("%l").rjust(2)
-    hours_img = get_time_img(font, hours_text)
-    mins_img = get_time_img(font, t.strftime("%M"))
+def compose_time_img(atlas, t: datetime) -> Image.Image:
+    return time_img(atlas, t.strftime("%l").rjust(2), t.strftime("%M"))
+
+
+# The digits only change once a minute, so a segment needs at most two of
+# these. The images are shared and must not be modified.
+@lru_cache(maxsize=4)
+def time_img(atlas, hours_text, mins_text) -> Image.Image:
+    hours_img = get_time_img(atlas, hours_text)
+    mins_img = get_time_img(atlas, mins_text)
     time_image = Image.new("L", (WIDTH, HEIGHT), color="black")
     time_image.paste(hours_img, box=(0, 0))
     time_image.paste(mins_img, box=(32, 0))
     return time_image
 
 
-def get_time_img(font, text):
+def get_time_img(atlas, text):
     image = Image.new("L", (32, 32), color=0)
-    draw = ImageDraw.Draw(image)
-    text_position = (0, 0)
-    draw.text(text_position, text, font=font, fill="white")
-
-    # Get the list of white pixel coordinates as a generator
-    pixels = image.load()
-    non_transparent_pixels = [
-        (x, y) for x in range(32) for y in range(32) if pixels[x, y] != 0
-    ]
+    atlas.draw(image, (0, 0), text, 255)
 
-    if not non_transparent_pixels:
+    bbox = image.getbbox()
+    if not bbox:
         return image
 
-    # Calculate the minimum and maximum x and y coordinates
-    x_coords, y_coords = zip(*non_transparent_pixels)
-    left, right = min(x_coords), max(x_coords)
-    top, bottom = min(y_coords), max(y_coords)
-
-    # Calculate the center position
-    center_x = (left + right) // 2
-    center_y = (top + bottom) // 2
+    # getbbox() is exclusive on the right and bottom
+    left, top, right, bottom = bbox
+    center_x = (left + right - 1) // 2
+    center_y = (top + bottom - 1) // 2
 
     # Calculate the offset to center the text within the 32x32 square
     offset_x = 16 - center_x
@@ -68,7 +87,6 @@ def get_time_img(font, text):
 
 
 def get_ray_image(radian) -> Image.Image:
-    image = Image.new("L", (SCALED_WIDTH, SCALED_HEIGHT), color="black")
     center_x, center_y = SCALED_WIDTH // 2, SCALED_HEIGHT // 2
     length = 400
 
@@ -76,136 +94,130 @@ def get_ray_image(radian) -> Image.Image:
     end_x = center_x + int(length * math.sin(radian))
     end_y = center_y - int(length * math.cos(radian))
 
-    draw = ImageDraw.Draw(image)
+    return ray_mask(end_x, end_y)
 
-    draw.line((center_x, center_y, end_x, end_y), fill="white", width=SCALE_FACTOR)
 
-    image = image.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
+# The sweep repeats every few seconds, so the same handful of ray and dot
+# positions come back over and over. Masks are keyed by their (integer)
+# supersampled end points, which quantizes the angle without changing a pixel,
+# and shared by every Renderer in the process. They must not be modified.
+@lru_cache(maxsize=1024)
+def ray_mask(end_x, end_y) -> Image.Image:
+    image = Image.new("L", (SCALED_WIDTH, SCALED_HEIGHT), color="black")
+    center_x, center_y = SCALED_WIDTH // 2, SCALED_HEIGHT // 2
+
+    draw = ImageDraw.Draw(image)
 
-    return image
+    draw.line((center_x, center_y, end_x, end_y), fill="white", width=SCALE_FACTOR)
 
+    return image.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
 
-def transform_ray(ray_image, time_image):
-    ray_pixels = ray_image.load()
-    time_pixels = time_image.load()
 
-    # Get the list of non-opaque pixel coordinates
-    non_opaque_pixels = [
-        (x, y) for x in range(WIDTH) for y in range(HEIGHT) if ray_pixels[x, y] != 0
-    ]
+@lru_cache(maxsize=1024)
+def dot_mask(x, y) -> Image.Image:
+    mask = Image.new("L", (SCALED_WIDTH, SCALED_HEIGHT), color=0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((x - 4, y - 4, x + 4, y + 4), fill=255)
+    return mask.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
 
-    # Calculate the distance from the origin for each non-opaque pixel
-    distances = [
-        math.sqrt((x - WIDTH // 2) ** 2 + (y - HEIGHT // 2) ** 2)
-        for x, y in non_opaque_pixels
-    ]
 
-    # Sort the non-opaque pixels based on their distances from the origin
-    sorted_pixels = [pixel for _, pixel in sorted(zip(distances, non_opaque_pixels))]
+def transform_ray(ray_image, time_image):
+    """
+    Fade the ray out behind the digits it has crossed.
 
-    # Create a new ray image
-    new_ray_image = Image.new("L", ray_image.size, color=0)
-    # Set the alpha value for each non-opaque pixel
-    step = 0
-    for x, y in sorted_pixels:
-        if time_pixels[x, y] != 0:
-            step += ray_pixels[x, y] * 0.1
+    Walking outwards from the center, every lit time pixel under the ray adds
+    a tenth of the ray's brightness there to a running step, which is
+    subtracted from the rest of the ray.
+    """
+    ray = np.asarray(ray_image).ravel()[RADIAL_ORDER]
+    time = np.asarray(time_image).ravel()[RADIAL_ORDER]
 
-        c = max(0, ray_pixels[x, y] - int(step))  # Accumulate the step down
-        new_ray_image.putpixel((x, y), c)
+    # Accumulate the step down; cumsum adds in order, just like a loop would
+    step = np.cumsum(np.where(time != 0, ray * 0.1, 0.0))
+    faded = np.maximum(0, ray - step.astype(np.int64))
 
-    return new_ray_image
+    pixels = np.empty(WIDTH * HEIGHT, dtype=np.uint8)
+    pixels[RADIAL_ORDER] = faded
+    return Image.fromarray(pixels.reshape(HEIGHT, WIDTH), "L")
 
 
 class SecondHand:
-    @dataclass
-    class Pixel:
-        color = (0, 0, 0)
-        alpha = 0
-        target_alpha = 0
-
-        def activate(self, color, alpha):
-            self.color = color
-            if alpha > self.target_alpha:
-                self.target_alpha = alpha
-                self.alpha = alpha
-
-        def step(self) -> Tuple[int, int, int, int]:
-            fade_rate = self.target_alpha / 30.0
-            if self.target_alpha > 0 and self.alpha > 0:
-                self.alpha = max(0, self.alpha - fade_rate)
-            return (*self.color, int(self.alpha))
+    """Red dot orbiting once a minute, leaving a trail where the ray crosses it."""
 
     def __init__(self):
         self.ellipse_a = int(WIDTH * 0.45)
         self.ellipse_b = int(HEIGHT * 0.45)
-        self.pixels = defaultdict(SecondHand.Pixel)
+        # Per-pixel trail state; pixels whose alpha reaches 0 are reset
+        self.alpha = np.zeros((HEIGHT, WIDTH))
+        self.target_alpha = np.zeros((HEIGHT, WIDTH))
+        self.color = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
         self.last_ray_angle = None
 
     def get_dot_img(self, angle):
-        mask = Image.new("L", (SCALED_WIDTH, SCALED_HEIGHT), color=0)
-        draw = ImageDraw.Draw(mask)
-
         x = SCALED_WIDTH / 2 + int(self.ellipse_a * SCALE_FACTOR * math.sin(angle))
         y = SCALED_HEIGHT / 2 - int(self.ellipse_b * SCALE_FACTOR * math.cos(angle))
-
-        draw.ellipse((x - 4, y - 4, x + 4, y + 4), fill=255)
-        return mask.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
+        return dot_mask(x, y)
 
     def compose_ray(self, timediff: timedelta, ray_angle, bg_image) -> Image.Image:
         second_hand_angle = datetime_to_radian(timediff, 60)
-        dot_mask = self.get_dot_img(second_hand_angle)
-
-        ray_mask = Image.new("L", (SCALED_WIDTH, SCALED_HEIGHT), color=0)
-        draw = ImageDraw.Draw(ray_mask)
+        dot_img = self.get_dot_img(second_hand_angle)
 
         center_x, center_y = SCALED_WIDTH // 2, SCALED_HEIGHT // 2
         length = max(SCALED_WIDTH, SCALED_HEIGHT) * 2
         end_x = center_x + int(length * math.sin(ray_angle))
         end_y = center_y - int(length * math.cos(ray_angle))
 
-        draw.line((center_x, center_y, end_x, end_y), fill=255, width=SCALE_FACTOR)
-        ray_mask = ray_mask.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
-
-        ray_data = ray_mask.getdata()
-        dot_data = dot_mask.getdata()
+        ray = np.asarray(ray_mask(end_x, end_y))
+        dot = np.asarray(dot_img)
 
-        for y in range(HEIGHT):
-            for x in range(WIDTH):
-                index = y * WIDTH + x
-                if index < len(ray_data) and index < len(dot_data):
-                    if ray_data[index] > 20 and dot_data[index] > 0:
-                        pixel = self.pixels[(x, y)]
-                        brightness = dot_data[index]
-                        pixel.activate((255, 0, 0), brightness)
+        hit = (ray > 20) & (dot > 0)
+        self.color[hit] = (255, 0, 0)
+        brighter = hit & (dot > self.target_alpha)
+        self.target_alpha[brighter] = dot[brighter]
+        self.alpha[brighter] = dot[brighter]
 
         self.last_ray_angle = ray_angle
 
-        img = Image.new("RGBA", (WIDTH, HEIGHT), color=(0, 0, 0, 0))
+        fading = (self.target_alpha > 0) & (self.alpha > 0)
+        self.alpha[fading] = np.maximum(
+            0, self.alpha[fading] - self.target_alpha[fading] / 30.0
+        )
+        visible = self.alpha.astype(np.uint8)
+        gone = visible == 0
+        self.alpha[gone] = 0
+        self.target_alpha[gone] = 0
+        self.color[gone] = 0
 
-        for pos, pixel in list(self.pixels.items()):
-            color_with_alpha = pixel.step()
-            if color_with_alpha[3] > 0:
-                img.putpixel(pos, color_with_alpha)
-            else:
-                del self.pixels[pos]
+        return Image.fromarray(np.dstack((self.color, visible)), "RGBA")
 
-        return img
+    def snapshot(self) -> dict:
+        return {
+            "alpha": pack_array(self.alpha),
+            "target_alpha": pack_array(self.target_alpha),
+            "color": pack_array(self.color),
+            "last_ray_angle": self.last_ray_angle,
+        }
+
+    def restore(self, state: dict):
+        self.alpha = unpack_array(state["alpha"])
+        self.target_alpha = unpack_array(state["target_alpha"])
+        self.color = unpack_array(state["color"])
+        self.last_ray_angle = state["last_ray_angle"]
 
 
 class Renderer:
-    def __init__(self, font, start_time):
-        self.font = font
+    def __init__(self, atlas, start_time, rng: Optional[random.Random] = None):
+        self.atlas = atlas
         self.start_time = start_time
         self.alpha = Image.new("L", (WIDTH, HEIGHT))
         self.time_pixels = TimePixels()
-        self.background = Background()
+        self.background = Background(rng)
         self.second_hand = SecondHand()
 
     def render_frame(self, t):
         time_diff = t - self.start_time
         background_img = self.background.render_frame()
-        time_image = compose_time_img(self.font, t)
+        time_image = compose_time_img(self.atlas, t)
         ray_angle = datetime_to_radian(time_diff, 9)
         ray_image = get_ray_image(ray_angle)
 
@@ -219,6 +231,22 @@ class Renderer:
 
         return img
 
+    def snapshot(self) -> dict:
+        """Everything the next frame depends on besides its time, as JSON."""
+        return {
+            "start_time": self.start_time.isoformat(),
+            "background": self.background.snapshot(),
+            "time_pixels": self.time_pixels.snapshot(),
+            "second_hand": self.second_hand.snapshot(),
+        }
+
+    def restore(self, state: dict):
+        """Carry on from a snapshot, sweeping on from where it left off."""
+        self.start_time = datetime.fromisoformat(state["start_time"])
+        self.background.restore(state["background"])
+        self.time_pixels.restore(state["time_pixels"])
+        self.second_hand.restore(state["second_hand"])
+
 
 def datetime_to_radian(time_diff: timedelta, steps):
     total_milliseconds = time_diff.total_seconds() * 1000
@@ -227,43 +255,43 @@ def datetime_to_radian(time_diff: timedelta, steps):
 
 
 class TimePixels:
-    @dataclass
-    class Pixel:
-        alpha = 0.0
-        velocity = 0.0
-        color: Tuple[int, int, int] = (0, 0, 0)
-
-        def step(self) -> Tuple[int, int, int]:
-            alpha = max(0.0, self.alpha + self.velocity)
-            if alpha > 1.0:
-                alpha = 1.0
-                self.velocity = -0.01
-            self.alpha = alpha
-            return tuple(int(c * self.alpha) for c in self.color)
+    """Digits that light up in the background color where the ray hits them."""
 
     def __init__(self):
-        d = defaultdict(TimePixels.Pixel)
-        self.pixels: dict[Tuple[int, int], TimePixels.Pixel] = d
+        self.alpha = np.zeros((HEIGHT, WIDTH))
+        self.velocity = np.zeros((HEIGHT, WIDTH))
+        self.color = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
 
     def zap_with_ray(self, time_image, ray_image, bg_image):
-        ray_pixels = ray_image.load()
-        time_image_pixels = time_image.load()
-        bg_pixels = bg_image.load()
-        for x in range(WIDTH):
-            for y in range(HEIGHT):
-                a = ray_pixels[x, y]
-                if a > 15 and time_image_pixels[x, y]:
-                    pxl = self.pixels[x, y]
-                    pxl.velocity = 0.18
-                    pxl.color = bg_pixels[x, y]
-        img = Image.new("RGB", (WIDTH, HEIGHT), color="black")
-        for point, px in self.pixels.items():
-            img.putpixel(point, px.step())
-        return img
+        zapped = (np.asarray(ray_image) > 15) & (np.asarray(time_image) != 0)
+        self.velocity[zapped] = 0.18
+        self.color[zapped] = np.asarray(bg_image)[zapped]
+
+        alpha = np.maximum(0.0, self.alpha + self.velocity)
+        peaked = alpha > 1.0
+        alpha[peaked] = 1.0
+        self.velocity[peaked] = -0.01
+        self.alpha = alpha
+
+        pixels = self.color * alpha[..., np.newaxis]
+        return Image.fromarray(pixels.astype(np.uint8), "RGB")
+
+    def snapshot(self) -> dict:
+        return {
+            "alpha": pack_array(self.alpha),
+            "velocity": pack_array(self.velocity),
+            "color": pack_array(self.color),
+        }
+
+    def restore(self, state: dict):
+        self.alpha = unpack_array(state["alpha"])
+        self.velocity = unpack_array(state["velocity"])
+        self.color = unpack_array(state["color"])
 
 
 class Background:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
         self.width = WIDTH
         self.height = HEIGHT
         self.center_x = WIDTH // 2
@@ -271,7 +299,7 @@ class Background:
         self.center_color = (155, 155, 175)
         self.edge_color = (175, 135, 155)
         self.velocity = [0.5, -3.0, 4.0]
-        drop_color = random.randint(0, 2)
+        drop_color = self.rng.randint(0, 2)
         self.floor_colors = [0.0 if n == drop_color else 125.0 for n in range(3)]
 
     def shift_colors(self):
@@ -279,7 +307,7 @@ class Background:
             c = self.center_color[i]
             floor = self.floor_colors[i]
             v = self.velocity[i]
-            r = 5 * random.random()
+            r = 5 * self.rng.random()
             if c <= floor and v < 0:
                 self.velocity[i] = r
             elif c >= 255.0 and v > 0:
@@ -295,27 +323,24 @@ class Background:
         self.center_color = apply_velocity(self.center_color)
         self.edge_color = apply_velocity(self.edge_color)
 
+    def snapshot(self) -> dict:
+        return {
+            "center_color": list(self.center_color),
+            "edge_color": list(self.edge_color),
+            "velocity": list(self.velocity),
+            "floor_colors": list(self.floor_colors),
+        }
+
+    def restore(self, state: dict):
+        self.center_color = tuple(state["center_color"])
+        self.edge_color = tuple(state["edge_color"])
+        self.velocity = list(state["velocity"])
+        self.floor_colors = list(state["floor_colors"])
+
     def render_frame(self):
         self.shift_colors()
-        # Create a new PIL image
-        image = Image.new("RGB", (self.width, self.height))
-        pixels = image.load()
-        max_distance = math.sqrt(self.center_x**2 + self.center_y**2)
-
-        for y in range(self.height):
-            for x in range(self.width):
-                distance = math.sqrt(
-                    (x - self.center_x) ** 2 + (y - self.center_y) ** 2
-                )
-                normalized_distance = distance / max_distance
-
-                # Interpolate between center color and edge color based on the normalized distance
-                color = tuple(
-                    int(c + (e - c) * normalized_distance)
-                    for c, e in zip(self.center_color, self.edge_color)
-                )
-
-                # Set the pixel color in the PIL image
-                pixels[x, y] = color
-
-        return image
+        # Interpolate between center color and edge color based on the normalized distance
+        center = np.array(self.center_color)
+        edge = np.array(self.edge_color)
+        pixels = center + (edge - center) * NORMALIZED_DISTANCE
+        return Image.fromarray(pixels.astype(np.uint8), "RGB")
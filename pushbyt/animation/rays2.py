@@ -1,127 +1,198 @@
-from PIL import Image, ImageDraw, ImageFont, ImageChops
+from PIL import Image
 import math
 import random
 from datetime import datetime
-from dataclasses import dataclass
-from typing import Generator
-
-
-@dataclass(frozen=True)
-class Point:
-    x: float
-    y: float
-
-    def to_tuple(self):
-        return (self.x, self.y)
+from functools import lru_cache
+import numpy as np
+from pushbyt.animation.fonts import get_atlas, PIXEL12X10
+from pushbyt.animation.snapshot import pack_array, unpack_array
+from typing import Generator, Optional
 
 
 WIDTH, HEIGHT = 64, 32
-SCALE_FACTOR = 4
-CENTER = Point(SCALE_FACTOR * WIDTH / 2, SCALE_FACTOR * HEIGHT / 2)
-SCALED_WIDTH, SCALED_HEIGHT = SCALE_FACTOR * WIDTH, SCALE_FACTOR * HEIGHT
-
-
+CENTER_X, CENTER_Y = WIDTH / 2, HEIGHT / 2
+RAY_COLOR = np.array((255, 150, 150), dtype=np.int16)
+RAY_COLOR_STEP = np.array((-10, 0, 10), dtype=np.int16)
+# How far along a ray its ends start and move each frame, in screen widths
+RAY_START, RAY_START_SPEED = 0.0, 0.04
+RAY_END, RAY_END_SPEED = 0.01, 0.06
+# Points sampled along a ray when drawing it
+RAY_SAMPLES_PER_PIXEL = 4
+# Image.blend works in single precision
+TIME_FADE = np.float32(0.04)
+
+
+# The time text only changes once a minute, so keep the last few pixel lists
+@lru_cache(maxsize=4)
 def get_time_pixels(time_str):
-    image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
-    font = ImageFont.truetype("./fonts/pixel12x10/Pixel12x10-v1.1.0.ttf", 16)
-    draw = ImageDraw.Draw(image)
-    text_position = (0, 0)
-    bbox = draw.textbbox(text_position, time_str, font=font)
-    left, top, right, bottom = bbox
-    text_width = right - left
-    text_height = bottom - top
-
-    # Calculate the new coordinates to center the bounding box
-    new_left = (WIDTH - text_width) // 2
-    new_top = (HEIGHT - text_height) // 2
-    draw.text((new_left, new_top), time_str, font=font, fill="white")
-    pixels = image.load()
-    return [
-        (x, y) for x in range(WIDTH) for y in range(HEIGHT) if pixels[x, y] != (0, 0, 0)
-    ]
+    image = Image.new("L", (WIDTH, HEIGHT), color="black")
+    atlas = get_atlas(*PIXEL12X10)
+    atlas.draw(image, atlas.center(time_str, image.size), time_str, 255)
+    xs, ys = np.nonzero(np.asarray(image).T)
+    return tuple(zip(xs.tolist(), ys.tolist()))
 
 
-frames = [Image.new("RGB", (WIDTH, HEIGHT), color="black")]
-
+@lru_cache(maxsize=4)
+def get_time_mask(time_str):
+    """get_time_pixels as a mask of the screen."""
+    mask = np.zeros((HEIGHT, WIDTH), dtype=bool)
+    xs, ys = np.array(get_time_pixels(time_str), dtype=int).reshape(-1, 2).T
+    mask[ys, xs] = True
+    mask.flags.writeable = False
+    return mask
 
-@dataclass
-class Ray:
-    angle: float
-    _start: float = 0.0
-    _end: float = 0.01
-    color = (255, 150, 150)
 
-    @classmethod
-    def new(cls):
-        angle = random.uniform(0, 2 * math.pi)
-        return Ray(angle)
+frames = [Image.new("RGB", (WIDTH, HEIGHT), color="black")]
 
-    def to_line(self):
-        return [self.start.to_tuple(), self.end.to_tuple()]
 
-    def is_in_bounds(self):
-        return (
-            self.start.x >= 0
-            and self.start.x < SCALED_WIDTH
-            and self.start.y >= 0
-            and self.start.y < SCALED_HEIGHT
+class RayField:
+    """
+    Rays shooting out of the center, as one array per attribute.
+
+    Each ray is a one pixel wide segment along its angle, between `start`
+    and `end` screen widths from the center. All of them are drawn at once
+    at the screen's resolution: points are sampled along every ray and
+    splatted onto their four nearest pixels, so the cost grows with the
+    total length of the rays rather than with their number times the screen.
+    """
+
+    def __init__(self):
+        self.angle = np.zeros(0)
+        self.start = np.zeros(0)
+        self.end = np.zeros(0)
+        self.color = np.zeros((0, 3), dtype=np.int16)
+
+    def __len__(self):
+        return len(self.angle)
+
+    def add(self, angles):
+        count = len(angles)
+        self.angle = np.concatenate([self.angle, angles])
+        self.start = np.concatenate([self.start, np.full(count, RAY_START)])
+        self.end = np.concatenate([self.end, np.full(count, RAY_END)])
+        self.color = np.concatenate([self.color, np.tile(RAY_COLOR, (count, 1))])
+
+    def draw(self) -> np.ndarray:
+        """The rays on black, as RGB pixels of the screen."""
+        lengths = (self.end - self.start) * WIDTH
+        counts = np.ceil(lengths * RAY_SAMPLES_PER_PIXEL).astype(int) + 1
+        ray = np.repeat(np.arange(len(self)), counts)
+        # Samples spread evenly over each ray, in pixels from the center
+        index = np.arange(len(ray)) - np.repeat(np.cumsum(counts) - counts, counts)
+        fraction = (index + 0.5) / counts[ray]
+        distance = (self.start[ray] + fraction * (self.end - self.start)[ray]) * WIDTH
+        # Relative to the first pixel's center
+        x = CENTER_X - 0.5 + distance * np.cos(self.angle)[ray]
+        y = CENTER_Y - 0.5 + distance * np.sin(self.angle)[ray]
+        left, top = np.floor(x).astype(int), np.floor(y).astype(int)
+        right, bottom = x - left, y - top
+        # Each sample carries its share of the ray's length to its four pixels
+        weight = (lengths / counts)[ray]
+        px = np.concatenate([left, left + 1, left, left + 1])
+        py = np.concatenate([top, top, top + 1, top + 1])
+        share = np.concatenate(
+            [
+                weight * (1 - right) * (1 - bottom),
+                weight * right * (1 - bottom),
+                weight * (1 - right) * bottom,
+                weight * right * bottom,
+            ]
+        )
+        on_screen = (px >= 0) & (px < WIDTH) & (py >= 0) & (py < HEIGHT)
+        pixel = (py * WIDTH + px)[on_screen]
+        share = share[on_screen]
+        ray = np.tile(ray, 4)[on_screen]
+        pixels = np.stack(
+            [
+                np.bincount(
+                    pixel,
+                    share * np.take(self.color[:, channel], ray),
+                    minlength=HEIGHT * WIDTH,
+                )
+                for channel in range(3)
+            ],
+            axis=-1,
         )
+        pixels = np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+        return pixels.reshape(HEIGHT, WIDTH, 3)
 
     def animate(self):
-        self._start += 0.04
-        self._end += 0.06
-        self.color = combine_colors(self.color, (-10, 0, 10))
-        assert len(self.color) == 3
-
-    @property
-    def start(self):
-        return self._to_point(self._start)
-
-    @property
-    def end(self):
-        return self._to_point(self._end)
-
-    def _to_point(self, percent):
-        x = CENTER.x + SCALED_WIDTH * percent * math.cos(self.angle)
-        y = CENTER.y + SCALED_WIDTH * percent * math.sin(self.angle)
-        return Point(x, y)
-
-
-def clock_rays() -> Generator[Image.Image, datetime, None]:
-    rays = []
-    black_image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
-    time_image = black_image.copy()
-    time_str = None
-    next_frame = black_image
+        self.start += RAY_START_SPEED
+        self.end += RAY_END_SPEED
+        self.color = np.clip(self.color + RAY_COLOR_STEP, 0, 255)
+
+    def snapshot(self) -> dict:
+        return {
+            "angle": pack_array(self.angle),
+            "start": pack_array(self.start),
+            "end": pack_array(self.end),
+            "color": pack_array(self.color),
+        }
+
+    def restore(self, state: dict):
+        self.angle = unpack_array(state["angle"])
+        self.start = unpack_array(state["start"])
+        self.end = unpack_array(state["end"])
+        self.color = unpack_array(state["color"])
+
+    def prune(self):
+        """Drop the rays whose start has left the screen."""
+        x = CENTER_X + WIDTH * self.start * np.cos(self.angle)
+        y = CENTER_Y + WIDTH * self.start * np.sin(self.angle)
+        keep = (x >= 0) & (x < WIDTH) & (y >= 0) & (y < HEIGHT)
+        self.angle = self.angle[keep]
+        self.start = self.start[keep]
+        self.end = self.end[keep]
+        self.color = self.color[keep]
+
+
+class Renderer:
+    """Rays, and the time lighting up where they pass through it."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        self.rays = RayField()
+        self.time_pixels = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    def render_frame(self, t: datetime) -> Image.Image:
+        time_mask = get_time_mask(t.strftime("%-I:%M"))
+        rng = self.rng
+        self.rays.add([rng.uniform(0, 2 * math.pi) for _ in range(rng.randint(1, 4))])
+
+        image = self.rays.draw()
+        self.rays.animate()
+
+        # Rays passing through the time add to it
+        time_pixels = self.time_pixels
+        lit = image[time_mask] + time_pixels[time_mask].astype(np.int16)
+        time_pixels[time_mask] = np.minimum(lit, 255)
+
+        # Screen the time over the rays, like ImageChops.screen
+        inverse = (255 - image.astype(np.uint16)) * (255 - time_pixels) // 255
+        frame = Image.fromarray((255 - inverse).astype(np.uint8), "RGB")
+        # Fade the time, like Image.blend with black
+        faded = time_pixels.astype(np.float32)
+        self.time_pixels = (faded - TIME_FADE * faded).astype(np.uint8)
+        self.rays.prune()
+        return frame
+
+    def snapshot(self) -> dict:
+        """Everything the next frame depends on besides its time, as JSON."""
+        return {
+            "rays": self.rays.snapshot(),
+            "time_pixels": pack_array(self.time_pixels),
+        }
+
+    def restore(self, state: dict):
+        self.rays.restore(state["rays"])
+        self.time_pixels = unpack_array(state["time_pixels"])
+
+
+def clock_rays(
+    rng: Optional[random.Random] = None,
+) -> Generator[Image.Image, datetime, None]:
+    renderer = Renderer(rng)
+    next_frame = Image.new("RGB", (WIDTH, HEIGHT), color="black")
     while True:
         t = yield next_frame
-        time_str = t.strftime("%-I:%M")
-        all_time_pixels = get_time_pixels(time_str)
-        for _ in range(random.randint(1, 4)):
-            rays.append(Ray.new())
-
-        image = Image.new("RGB", (SCALED_WIDTH, SCALED_HEIGHT), color="black")
-        draw = ImageDraw.Draw(image)
-        for ray in rays:
-            draw.line(ray.to_line(), fill=ray.color, width=SCALE_FACTOR)
-            ray.animate()
-
-        # Downsample the high-resolution image to the desired size
-        image_lo = image.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
-        image_pixels = image_lo.load()
-        time_pixels = time_image.load()
-        for x, y in all_time_pixels:
-            time_image.putpixel(
-                (x, y), combine_colors(image_pixels[x, y], time_pixels[x, y])
-            )
-
-        next_frame = ImageChops.screen(image_lo, time_image)
-        # fade time image
-        time_image = Image.blend(time_image, black_image, alpha=0.04)
-        rays = [ray for ray in rays if ray.is_in_bounds()]
-
-
-def combine_colors(aa, bb):
-    color = tuple(max(0, min(255, a + b)) for a, b in zip(aa, bb))
-    assert len(color) == 3
-    return color
+        next_frame = renderer.render_frame(t)
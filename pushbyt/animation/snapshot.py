@@ -0,0 +1,18 @@
+import base64
+import zlib
+import numpy as np
+
+
+def pack_array(array: np.ndarray) -> dict:
+    """An array as JSON, compressed. Renderer state is mostly zeros."""
+    return {
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+        "data": base64.b64encode(zlib.compress(array.tobytes(), 9)).decode(),
+    }
+
+
+def unpack_array(packed: dict) -> np.ndarray:
+    data = zlib.decompress(base64.b64decode(packed["data"]))
+    array = np.frombuffer(data, dtype=np.dtype(packed["dtype"]))
+    return array.reshape(packed["shape"]).copy()
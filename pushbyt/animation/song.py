@@ -1,61 +1,70 @@
-from PIL import Image, ImageDraw, ImageFont, ImageChops
-from collections import defaultdict
-from typing import Generator, Optional
+from PIL import Image, ImageDraw
+from typing import Generator, Optional, Tuple
+from functools import lru_cache
 from io import BytesIO
+from itertools import cycle
+import numpy as np
 import requests
 import textwrap
 import logging
 from unidecode import unidecode
+from pathlib import Path
+from pushbyt.animation.art_cache import ArtCache
+from pushbyt.animation.fonts import get_atlas, PIXELMIX
 
 
 logger = logging.getLogger(__name__)
 WIDTH, HEIGHT = 64, 32
 BORDER_HEIGHT = 3
 ART_HEIGHT = 64
-
-
-def step_color(pixel, amount):
-    def step(c):
-        return max(0, min(255, c + round(amount)))
-
-    r, g, b = pixel
-    return step(r), step(g), step(b)
+FONT_WRAP_WIDTH = 12
+# Finished renders are cached for a month by the track, so bump this whenever
+# song_info's output changes (layout, text rendering, fonts)
+RENDER_VERSION = 1
+# (connect, read) seconds; generate() waits for checks, so this is the real limit
+ART_TIMEOUT = (3.05, 10)
+# Keep-alive connections to the art CDN, shared by every render
+SESSION = requests.Session()
+ART_CACHE = ArtCache(Path("render") / "cache" / "art")
 
 
 def song_info(
     title: str, artist: str, art_url: Optional[str]
 ) -> Generator[Image.Image, str, None]:
-    font = ImageFont.truetype("./fonts/pixelmix/pixelmix.ttf", 8)
     if not art_url:
         raise ValueError("Missing art not handled")
-    art_scroll = gen_album_art(art_url)
+    yield from song_frames(title, artist, *load_art(art_url))
+
+
+def song_frames(
+    title: str,
+    artist: str,
+    art: Image.Image,
+    dominant_color: Optional[Tuple[int, int, int]] = None,
+) -> Generator[Image.Image, str, None]:
+    atlas = get_atlas(*PIXELMIX)
+    art_scroll = gen_album_art(art, dominant_color)
     for _ in range(10):
         yield next(art_scroll)
-    title_scroll = gen_text(title, font, 50)
-    artist_scroll = gen_text(artist, font, 51)
+    title_scroll = gen_text_masks(title, atlas, 50)
+    artist_scroll = gen_text_masks(artist, atlas, 51)
 
     black_img = Image.new("RGB", (WIDTH, HEIGHT), color="black")
     for i in range(50):
-        title_img = next(title_scroll)
+        title_mask = next(title_scroll)
         art_img = next(art_scroll)
         fade = min(1, i / 25)
-        yield screen_img(fade, title_img, art_img)
+        yield screen_mask(fade, title_mask, art_img)
 
-    artist_img = next(artist_scroll)
+    artist_mask = next(artist_scroll)
     for i in range(15):
         art_img = next(art_scroll)
-        perc = i / 15
-        processed_title = screen_img(1, title_img, art_img)
-        processed_artist = screen_img(1, artist_img, art_img)
-        faded_title = Image.blend(black_img, processed_title, 1 - perc)
-        faded_artist = Image.blend(black_img, processed_artist, perc)
-        yield ImageChops.lighter(faded_title, faded_artist)
+        yield crossfade_img(i / 15, title_mask, artist_mask, art_img)
 
     for i in range(50):
-        artist_img = next(artist_scroll)
+        artist_mask = next(artist_scroll)
         art_img = next(art_scroll)
-        fade = min(1, 1 - (i - 25) / 25)
-        yield screen_img(1 - i / 50, artist_img, art_img)
+        yield screen_mask(1 - i / 50, artist_mask, art_img)
 
     for i in range(25):
         art_img = next(art_scroll)
@@ -63,34 +72,69 @@ def song_info(
 
 
 def screen_img(fade, text_img, art_img):
-    processed_image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
-    text_pixels = text_img.load()
-    art_pixels = art_img.load()
-    for x in range(WIDTH):
-        for y in range(HEIGHT):
-            is_in_title = text_pixels[x, y] != (0, 0, 0)
-            if is_in_title:
-                step = 200
-            else:
-                step = -180
-            new_color = step_color(art_pixels[x, y], step * fade)
-            processed_image.putpixel((x, y), new_color)
-    return processed_image
-
-
-def gen_text(text, font, step_count):
-    FONT_WRAP_WIDTH = 12
-    wrapped_title = textwrap.wrap(unidecode(text), width=FONT_WRAP_WIDTH)
-    title_img = text_image(wrapped_title, font)
-    _, title_height = title_img.size
-    needs_scroll = title_height > HEIGHT
-
+    """Brighten the art under the text and darken it everywhere else."""
+    return screen_mask(fade, np.asarray(text_img).any(axis=2), art_img)
+
+
+def screen_mask(fade, mask, art_img):
+    """screen_img for a text mask of the screen's size."""
+    step = np.where(mask[..., None], round(200 * fade), round(-180 * fade))
+    pixels = np.asarray(art_img).astype(np.int16) + step
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def crossfade_img(perc, from_mask, to_mask, art_img):
+    """
+    Fade from one text screened over the art to another.
+
+    The same as blending each screen_img with black and taking the lighter
+    of the two, including `Image.blend` scaling in single precision and
+    truncating.
+    """
+    masks = np.stack([from_mask, to_mask])[..., None]
+    pixels = np.asarray(art_img).astype(np.int16) + np.where(masks, 200, -180)
+    screened = np.clip(pixels, 0, 255).astype(np.float32)
+    alpha = np.array([1 - perc, perc], dtype=np.float32)[:, None, None, None]
+    faded = (screened * alpha).astype(np.uint8)
+    return Image.fromarray(faded.max(axis=0), "RGB")
+
+
+@lru_cache(maxsize=64)
+def text_layer(text, atlas):
+    """
+    The text wrapped and drawn, and a mask of where it's lit. Cached.
+
+    The mask has a screen's worth of blank rows above and below, so that
+    short text can be centered with a plain slice.
+    """
+    wrapped = textwrap.wrap(unidecode(text), width=FONT_WRAP_WIDTH)
+    image = text_image(wrapped, atlas)
+    mask = np.zeros((image.height + 2 * HEIGHT, WIDTH), dtype=bool)
+    mask[HEIGHT:-HEIGHT] = np.asarray(image).any(axis=2)
+    mask.flags.writeable = False
+    return image, mask
+
+
+def text_offsets(text_height, step_count):
+    """Top row of the text shown on each step: scrolled if it's tall, else centered."""
+    needs_scroll = text_height > HEIGHT
     for i in range(step_count):
         if needs_scroll:
-            title_overhang = step_count - (title_height - HEIGHT)
-            title_y = min(title_height - HEIGHT, max(0, i - title_overhang // 2))
+            overhang = step_count - (text_height - HEIGHT)
+            yield min(text_height - HEIGHT, max(0, i - overhang // 2))
         else:
-            title_y = title_height // 2 - 16
+            yield text_height // 2 - 16
+
+
+def gen_text_masks(text, atlas, step_count):
+    _, mask = text_layer(text, atlas)
+    for y in text_offsets(mask.shape[0] - 2 * HEIGHT, step_count):
+        yield mask[HEIGHT + y : 2 * HEIGHT + y]
+
+
+def gen_text(text, atlas, step_count):
+    title_img, _ = text_layer(text, atlas)
+    for title_y in text_offsets(title_img.height, step_count):
         yield title_img.crop((0, title_y, WIDTH, title_y + HEIGHT))
 
     # for top in range(0, HEIGHT):
@@ -148,75 +192,77 @@ def gen_text(text, font, step_count):
     # yield black_img
 
 
-def gen_album_art(art_url):
-    response = requests.get(art_url)
-    art_data = response.content
-    art = Image.open(BytesIO(art_data))
+def load_art(art_url) -> Tuple[Image.Image, Tuple[int, int, int]]:
+    """The 64x64 art and its dominant color, from the cache when possible."""
+    cached = ART_CACHE.fetch(art_url)
+    if cached:
+        return cached
+    response = SESSION.get(art_url, timeout=ART_TIMEOUT)
+    response.raise_for_status()
+    art = Image.open(BytesIO(response.content)).convert("RGB")
+    if art.size != (WIDTH, ART_HEIGHT):
+        art = art.resize((WIDTH, ART_HEIGHT), resample=Image.LANCZOS)
+    dominant_color = get_dominant_color(art)
+    ART_CACHE.store(art_url, art, dominant_color)
+    logger.info(f"Fetched {art_url}, {ART_CACHE}")
+    return art, dominant_color
+
+
+def gen_album_art(art, dominant_color=None):
     tiled_img = Image.new("RGB", (WIDTH, ART_HEIGHT * 2 + BORDER_HEIGHT), color="black")
     tiled_img.paste(art, (0, 0))
     tiled_img.paste(art, (0, ART_HEIGHT + BORDER_HEIGHT))
-    dominant_color = get_dominant_color(art)
+    dominant_color = dominant_color or get_dominant_color(art)
     border = gen_art_border(dominant_color)
     while True:
-        for top in range(0, ART_HEIGHT + 3):
-            frame = tiled_img.copy()
-            border_frame = next(border)
-            frame.paste(border_frame, (0, 64))
-            yield frame.crop((0, top, WIDTH, top + HEIGHT))
+        for top in range(0, ART_HEIGHT + BORDER_HEIGHT):
+            # Only the border moves, so it's drawn straight into the strip
+            # and each frame is just the crop
+            tiled_img.paste(next(border), (0, ART_HEIGHT))
+            yield tiled_img.crop((0, top, WIDTH, top + HEIGHT))
 
 
 def gen_art_border(color):
     diamonds = Image.new("RGB", (68, 3), color="black")
     draw = ImageDraw.Draw(diamonds)
-    reverse_dir = False
 
     for x in range(0, 68, 4):
         draw.polygon([(x, 1), (x + 1, 0), (x + 2, 1), (x + 1, 2)], fill=color)
 
-    while True:
-        reverse_dir = not reverse_dir
-        for _ in range(4):
-            for x in range(4):
-                if reverse_dir:
-                    x = 4 - x
-                yield diamonds.crop((x, 0, 64 + x, 3))
+    # Four steps one way, four times over, then the same back
+    offsets = [4 - x for x in range(4)] * 4 + [x for x in range(4)] * 4
+    phases = {x: diamonds.crop((x, 0, 64 + x, 3)) for x in set(offsets)}
+    yield from cycle([phases[x] for x in offsets])
 
 
 def get_dominant_color(image):
-    pixels = image.load()
-    width, height = image.size
-
-    color_count = defaultdict(int)
-
-    for x in range(width):
-        for y in range(height):
-            color = pixels[x, y]
-            quantized_color = tuple(int(channel / 10) for channel in color)
-            if sum(quantized_color) > 8:
-                color_count[quantized_color] += 1
-
-    if color_count:
-        dominant_color = max(color_count, key=color_count.get)
-        return tuple(channel * 10 for channel in dominant_color)
-    else:
+    """The most common color in steps of 10, ignoring near black. Any size."""
+    # Column by column, so that ties go to the color seen first, as they
+    # always have
+    pixels = np.asarray(image.convert("RGB")).transpose(1, 0, 2).reshape(-1, 3)
+    quantized = pixels // 10
+    quantized = quantized[quantized.sum(axis=1, dtype=np.int32) > 8]
+    if not len(quantized):
         return (255, 255, 255)
 
+    # Channels quantize to 0-25, five bits each
+    packed = (
+        quantized[:, 0].astype(np.int32) << 10
+        | quantized[:, 1].astype(np.int32) << 5
+        | quantized[:, 2]
+    )
+    counts = np.bincount(packed, minlength=1 << 15)
+    most_common = np.flatnonzero(counts == counts.max())
+    dominant = packed[np.isin(packed, most_common).argmax()]
+    return tuple(int(dominant >> shift & 31) * 10 for shift in (10, 5, 0))
+
 
-def text_image(lines, font):
+def text_image(lines, atlas):
     LINE_HEIGHT = 9
     y = 1
     height = y + len(lines) * LINE_HEIGHT
     image = Image.new("RGB", (WIDTH, height), color="black")
-    draw = ImageDraw.Draw(image)
     for line in lines:
-        # logger.info(f"{line} {font.getsize(line)}")
-        draw.text(
-            (HEIGHT, y),
-            line,
-            fill="white",
-            anchor="mt",
-            align="center",
-            font=font,
-        )
+        atlas.draw(image, (HEIGHT, y), line, "white", anchor="mt")
         y += 9
     return image
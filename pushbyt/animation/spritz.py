@@ -1,10 +1,11 @@
 import tempfile
 import subprocess
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 from abc import ABC, abstractmethod
 from typing import Generator
 from pathlib import Path
 from datetime import datetime, timedelta
+from pushbyt.animation.fonts import get_atlas, PIXELMIX
 
 
 class FrameGenerator(ABC):
@@ -57,25 +58,24 @@ class Spritz(FrameGenerator):
         self.tokens = self.tokenize(copy)
 
     def _gen_frames(self):
-        font = ImageFont.truetype("./fonts/pixelmix/pixelmix.ttf", 8)
+        atlas = get_atlas(*PIXELMIX)
         for token in self.tokens:
-            yield self.render(token, font)
+            yield self.render(token, atlas)
 
-    def render(self, token: str, font) -> Image.Image:
+    def render(self, token: str, atlas) -> Image.Image:
         # print(f"|{token}|")
         start, mid, end = self.word_split(token)
         image = Image.new("RGB", (self.WIDTH, self.HEIGHT), color="black")
-        draw = ImageDraw.Draw(image)
-        mid_width = self.measure(mid, font)
+        mid_width = self.measure(mid, atlas)
         mid_left = self.TEXT_MID - mid_width // 2
-        draw.text((mid_left, self.TEXT_TOP), mid, font=font, fill=(255, 50, 50))
+        atlas.draw(image, (mid_left, self.TEXT_TOP), mid, (255, 50, 50))
         if start:
-            start_width = self.measure(start, font)
+            start_width = self.measure(start, atlas)
             start_left = mid_left - start_width
-            draw.text((start_left, self.TEXT_TOP), start, font=font, fill="white")
+            atlas.draw(image, (start_left, self.TEXT_TOP), start, "white")
         if end:
             end_left = mid_left + mid_width
-            draw.text((end_left, self.TEXT_TOP), end, font=font, fill="white")
+            atlas.draw(image, (end_left, self.TEXT_TOP), end, "white")
         return image
 
     def word_split(self, token: str):
@@ -91,11 +91,8 @@ class Spritz(FrameGenerator):
         else:
             return token[0:3], token[3], token[4:]
 
-    def measure(self, text: str, font) -> int:
-        image = Image.new("RGB", (self.WIDTH, self.HEIGHT), color="black")
-        draw = ImageDraw.Draw(image)
-        bbox = draw.textbbox((0, 0), text, font=font)
-        left, _, right, _ = bbox
+    def measure(self, text: str, atlas) -> int:
+        left, _, right, _ = atlas.bbox(text)
         return right - left
 
     def tokenize(self, copy: str) -> Generator[str, None, None]:
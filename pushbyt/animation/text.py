@@ -0,0 +1,115 @@
+import string
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Glyphs compiled up front; anything else is compiled the first time it's drawn
+PRINTABLE = string.digits + string.ascii_letters + string.punctuation + " "
+
+
+@dataclass(frozen=True)
+class Glyph:
+    mask: np.ndarray  # rows x columns of coverage, 0-255
+    left: int  # offset of the mask from the pen position
+    top: int  # offset of the mask from the ascender line
+    advance: int
+
+
+class GlyphAtlas:
+    """
+    A pixel font pre-rendered into per-character bitmaps with their metrics.
+
+    Our fonts are bitmap fonts drawn at their native sizes: glyphs are
+    either fully on or off and there's no kerning. Laying out a string is
+    then just placing glyphs side by side, so drawing text is a blit of
+    cached masks instead of a trip through FreeType, pixel for pixel the same
+    as `ImageDraw.text` with the basic layout engine.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, chars: str = PRINTABLE):
+        self.font = font
+        self.ascent, self.descent = font.getmetrics()
+        self.glyphs: dict[str, Glyph] = {}
+        for char in chars:
+            self.glyph(char)
+        self.render = lru_cache(maxsize=256)(self._render)
+
+    def glyph(self, char: str) -> Glyph:
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            left, top, right, bottom = self.font.getbbox(char)
+            image = Image.new("L", (right - left, bottom - top))
+            ImageDraw.Draw(image).text((-left, -top), char, font=self.font, fill=255)
+            advance = int(self.font.getlength(char))
+            glyph = Glyph(np.asarray(image), left, top, advance)
+            self.glyphs[char] = glyph
+        return glyph
+
+    def length(self, text: str) -> int:
+        """Advance width of the text, like `ImageFont.getlength`."""
+        return sum(self.glyph(char).advance for char in text)
+
+    def bbox(self, text: str, anchor: str = "la") -> Tuple[int, int, int, int]:
+        """Bounding box relative to the anchor, like `ImageFont.getbbox`."""
+        if not text:
+            return 0, 0, 0, 0
+        left, top, right, bottom = self._layout_bbox(text)
+        x, y = self._anchor(text, anchor, top)
+        return left - x, top - y, right - x, bottom - y
+
+    def center(self, text: str, size: Tuple[int, int]) -> Tuple[int, int]:
+        """Where to draw the text so its bounding box is centered in `size`."""
+        left, top, right, bottom = self.bbox(text)
+        width, height = size
+        return (width - (right - left)) // 2, (height - (bottom - top)) // 2
+
+    def draw(self, image: Image.Image, xy, text: str, fill, anchor: str = "la"):
+        """Draw text onto an image, like `ImageDraw.text` with a single line."""
+        mask, (x, y) = self.render(text, anchor)
+        if mask is not None:
+            image.paste(fill, (int(xy[0]) + x, int(xy[1]) + y), mask)
+
+    def _render(self, text: str, anchor: str):
+        """Mask of the whole string and its offset from the anchor. Cached."""
+        left, top, right, bottom = self._layout_bbox(text)
+        if right <= left or bottom <= top:
+            return None, (0, 0)
+        pixels = np.zeros((bottom - top, right - left), dtype=np.uint8)
+        pen = 0
+        for char in text:
+            glyph = self.glyph(char)
+            height, width = glyph.mask.shape
+            x, y = pen + glyph.left - left, glyph.top - top
+            region = pixels[y : y + height, x : x + width]
+            np.maximum(region, glyph.mask, out=region)
+            pen += glyph.advance
+        anchor_x, anchor_y = self._anchor(text, anchor, top)
+        return Image.fromarray(pixels, "L"), (left - anchor_x, top - anchor_y)
+
+    def _layout_bbox(self, text: str) -> Tuple[int, int, int, int]:
+        if not text:
+            return 0, 0, 0, 0
+        left, top, right, bottom = 0, self.ascent, 0, 0
+        pen = 0
+        for char in text:
+            glyph = self.glyph(char)
+            height, width = glyph.mask.shape
+            left = min(left, pen + glyph.left)
+            right = max(right, pen + glyph.left + width)
+            top = min(top, glyph.top)
+            bottom = max(bottom, glyph.top + height)
+            pen += glyph.advance
+        return left, top, max(right, pen), bottom
+
+    def _anchor(self, text: str, anchor: str, top: int) -> Tuple[int, int]:
+        """Position of the anchor relative to the pen start and ascender."""
+        horizontal, vertical = anchor
+        length = self.length(text)
+        # FreeType rounds half way anchors up
+        x = {"l": 0, "m": (length + 1) // 2, "r": length}
+        y = {"a": 0, "t": top, "s": self.ascent, "d": self.ascent + self.descent}
+        if horizontal not in x or vertical not in y:
+            raise ValueError(f"Unsupported anchor {anchor}")
+        return x[horizontal], y[vertical]
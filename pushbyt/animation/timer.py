@@ -1,8 +1,11 @@
-from PIL import Image, ImageDraw, ImageFont
-from typing import Generator
+from PIL import Image, ImageDraw
+from functools import lru_cache
+from typing import Generator, Tuple
 import logging
+import numpy as np
 from datetime import timedelta
 from pushbyt.animation.util import FRAME_TIME
+from pushbyt.animation.fonts import get_atlas, UPHEAVAL
 
 
 logger = logging.getLogger(__name__)
@@ -10,10 +13,15 @@ WIDTH, HEIGHT = 64, 32
 
 DIGIT_WIDTH = 12
 DIGIT_HEIGHT = 10
+DIGITS = "0123456789"
+# Part of the key of every cached timer clip. Bump it whenever the frames
+# come out differently (drawing code, digit font), or old clips keep being
+# served: timer lengths recur, so they never age out of the cache.
+RENDER_VERSION = 1
 
 
 def timer(delta: timedelta) -> Generator[Image.Image, str, None]:
-    font = ImageFont.truetype("fonts/upheaval/upheavtt.ttf", 20)
+    transitions = digit_transitions()
     td = delta
     while td > -timedelta(seconds=10):
         sub_second = td.microseconds // FRAME_TIME.microseconds
@@ -21,7 +29,7 @@ def timer(delta: timedelta) -> Generator[Image.Image, str, None]:
             current_digits = to_min_sec(td)
             next_digits = to_min_sec(td - timedelta(seconds=1))
             digit_images = [
-                combine_digits(font, sub_second, c, n)
+                transitions[c, n, sub_second]
                 for c, n in zip(current_digits, next_digits)
             ]
             yield text_image(digit_images, sub_second)
@@ -31,40 +39,59 @@ def timer(delta: timedelta) -> Generator[Image.Image, str, None]:
         td -= FRAME_TIME
 
 
-def combine_digits(font, sub_second, old_digit, new_digit):
-    old_img = digit_image(old_digit, font)
-    if sub_second > 7 or old_digit == new_digit:
-        return old_img
-
-    step = 7 - sub_second
-
-    new_img = digit_image(new_digit, font)
-    oldp = old_img.load()
-    newp = new_img.load()
+@lru_cache(maxsize=None)
+def digit_transitions() -> dict[Tuple[str, str, int], Image.Image]:
+    """
+    Every digit rolling into every other digit, at each tenth of a second.
+
+    There are only a thousand of them, so they are rendered once per process
+    and each timer frame is just four pastes plus the colon. The images are
+    shared and must not be modified.
+    """
+    atlas = get_atlas(*UPHEAVAL)
+    digit_images = [digit_image(digit, atlas) for digit in DIGITS]
+    digits = np.stack([np.asarray(image) for image in digit_images])
+    # Indexed by old digit, new digit and sub second; only the first eight
+    # sub seconds of a change are a transition
+    steps = 7 - np.arange(8)[:, np.newaxis, np.newaxis, np.newaxis]
+    rolled = roll_digits(
+        digits[:, np.newaxis, np.newaxis], digits[np.newaxis, :, np.newaxis], steps
+    )
+    transitions = {}
+    for i, old in enumerate(DIGITS):
+        for j, new in enumerate(DIGITS):
+            for sub_second in range(10):
+                if sub_second > 7 or old == new:
+                    image = digit_images[i]
+                else:
+                    image = Image.fromarray(rolled[i, j, sub_second], "RGB")
+                transitions[old, new, sub_second] = image
+    return transitions
+
+
+def roll_digits(old, new, step):
+    """
+    Roll from the old digit images to the new ones, `step` rows out from the
+    middle. Broadcasts over any leading axes.
+    """
     mid = DIGIT_HEIGHT // 2
     top = mid - step
     bot = mid + step
-    compo_img = Image.new("RGB", (DIGIT_WIDTH, DIGIT_HEIGHT), "black")
-    for x in range(DIGIT_WIDTH):
-        for y in range(DIGIT_HEIGHT):
-            if y == top or y == bot:
-                inold = oldp[x, y] != (0, 0, 0)
-                innew = newp[x, y] != (0, 0, 0)
-                # this is frontier
-                if inold and innew:
-                    compo_img.putpixel((x, y), (255, 255, 255))
-                elif inold and not innew:
-                    compo_img.putpixel((x, y), (255, 0, 0))
-                elif innew and not inold:
-                    compo_img.putpixel((x, y), (0, 255, 0))
-                # else not in either
-            elif y < top or y > bot:
-                # show old
-                compo_img.putpixel((x, y), oldp[x, y])
-            else:
-                # show new
-                compo_img.putpixel((x, y), newp[x, y])
-    return compo_img
+    y = np.arange(DIGIT_HEIGHT)[:, np.newaxis, np.newaxis]
+    # Show the old digit outside the frontier rows and the new one inside
+    pixels = np.where((y < top) | (y > bot), old, new)
+
+    # On the frontier, white is in both digits, red only in the old one and
+    # green only in the new one
+    in_old = old.any(axis=-1, keepdims=True)
+    in_new = new.any(axis=-1, keepdims=True)
+    frontier = np.select(
+        [in_old & in_new, in_old, in_new],
+        [(255, 255, 255), (255, 0, 0), (0, 255, 0)],
+        (0, 0, 0),
+    )
+    pixels = np.where((y == top) | (y == bot), frontier, pixels)
+    return pixels.astype(np.uint8)
 
 
 def to_min_sec(td):
@@ -73,17 +100,9 @@ def to_min_sec(td):
     return [*f"{minutes:02d}{seconds:02d}"]
 
 
-def digit_image(c, font):
+def digit_image(c, atlas):
     image = Image.new("RGB", (DIGIT_WIDTH, DIGIT_HEIGHT), "black")
-    draw = ImageDraw.Draw(image)
-    draw.text(
-        (DIGIT_WIDTH // 2, 0),  # DIGIT_HEIGHT // 2),
-        # (0, 0), #DIGIT_HEIGHT // 2),
-        c,
-        fill="white",
-        anchor="mt",
-        font=font,
-    )
+    atlas.draw(image, (DIGIT_WIDTH // 2, 0), c, "white", anchor="mt")
     return image
 
 
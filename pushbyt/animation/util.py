@@ -1,42 +1,353 @@
 import tempfile
 import subprocess
+import hashlib
 import logging
+import multiprocessing
 import os
-from PIL import Image
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Optional
+import django
+from dataclasses import dataclass
+from PIL import Image, ImageChops
 from pathlib import Path
 from datetime import timedelta
+from pushbyt.animation import webp
+from pushbyt.animation.disk_cache import CacheStats
 
 logger = logging.getLogger(__name__)
 
 FRAME_TIME = timedelta(milliseconds=100)
+FRAME_MS = int(FRAME_TIME.total_seconds() * 1000)
 SWAP_PALETTE = bool(os.getenv("PUSHBYT_PALETTE_SWAP"))
+# "mux" encodes each frame with Pillow and assembles the animation's RIFF
+# chunks itself (webp.py); "webpmux" shells out to libwebp's webpmux tool
+ENCODER = os.getenv("PUSHBYT_ENCODER", "mux")
+# Emit a full frame every N frames and only the changed rectangle in between;
+# 1 makes every frame a full keyframe.
+KEYFRAME_INTERVAL = int(os.getenv("PUSHBYT_KEYFRAME_INTERVAL", "30"))
+# A change covering more of the frame than this is sent as the full frame:
+# cropping it saves next to no bytes but costs a crop and a rehash, and a
+# cropped frame can't be shared with the same full frame in another clip
+MAX_PARTIAL_AREA = 0.75
+# Size of the encoding pool shared by the whole process; 1 encodes serially.
+# Every gunicorn worker has its own pool, and each pool process loads Django,
+# so this stays small rather than following the CPU count.
+RENDER_WORKERS = int(os.getenv("PUSHBYT_RENDER_WORKERS", "2"))
 
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
 
-def render(frames, file_path) -> bool:
+
+class FrameCache(CacheStats):
+    """
+    Encoded frames keyed by content hash.
+
+    The clips of a segment overlap, so sharing one cache across them encodes
+    each distinct frame once and every later slice just reuses the bytes.
+    Only the most recently used `max_frames` are kept, which is plenty to
+    cover the overlap between neighbouring clips.
+    """
+
+    name = "frame cache"
+
+    def __init__(self, max_frames: int = 1024):
+        super().__init__()
+        self.frames: OrderedDict[bytes, bytes] = OrderedDict()
+        self.max_frames = max_frames
+        # Frames handed to a worker process by submit() and not yet collected
+        self.pending: dict[bytes, tuple[Future, int]] = {}
+
+    def encode(
+        self, frame_num: int, frame: Image.Image, key: Optional[bytes] = None
+    ) -> bytes:
+        key = key or frame_key(frame)
+        data = self.frames.get(key)
+        if data is not None:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return data
+
+        self.misses += 1
+        data = None
+        if key in self.pending:
+            future, index = self.pending.pop(key)
+            try:
+                data = future.result()[index]
+            except (BrokenProcessPool, CancelledError):
+                logger.warning(f"Lost frame {frame_num} from the pool, retrying")
+        if data is None:
+            data = encode_frame(frame_num, frame)
+        self.frames[key] = data
+        while len(self.frames) > self.max_frames:
+            self.frames.popitem(last=False)
+        return data
+
+    def submit(self, runs: list["FrameRun"], executor: ProcessPoolExecutor):
+        """Start encoding the frames that aren't cached yet in a worker process."""
+        missing = {}
+        for run in runs:
+            if run.key not in self.frames and run.key not in self.pending:
+                missing.setdefault(run.key, run)
+        if not missing:
+            return
+        future = executor.submit(
+            encode_batch,
+            [
+                (run.frame_num, run.frame.mode, run.frame.size, run.frame.tobytes())
+                for run in missing.values()
+            ],
+        )
+        for index, key in enumerate(missing):
+            self.pending[key] = future, index
+
+
+def frame_key(frame: Image.Image) -> bytes:
+    digest = hashlib.blake2b(frame.tobytes(), digest_size=16)
+    digest.update(f"{frame.mode}{frame.size}".encode())
+    return digest.digest()
+
+
+@dataclass
+class FrameRun:
+    """
+    A frame held on screen for the duration of its identical neighbours.
+
+    Partial frames only hold the rectangle that changed, placed at x, y.
+    """
+
+    frame_num: int
+    frame: Image.Image
+    key: bytes
+    duration: int = FRAME_MS
+    x: int = 0
+    y: int = 0
+
+
+def collapse_frames(frames) -> list[FrameRun]:
+    runs: list[FrameRun] = []
+    for i, frame in enumerate(frames):
+        key = frame_key(frame)
+        if runs and runs[-1].key == key:
+            runs[-1].duration += FRAME_MS
+        else:
+            runs.append(FrameRun(i, frame, key))
+    return runs
+
+
+def delta_frames(runs: list[FrameRun], keyframe_interval: int) -> list[FrameRun]:
+    """Crop each frame down to the area that changed since the one before it."""
+    previous = None
+    last_keyframe = 0
+    for run in runs:
+        frame = run.frame
+        is_keyframe = (
+            previous is None
+            or run.frame_num - last_keyframe >= keyframe_interval
+            or (previous.mode, previous.size) != (frame.mode, frame.size)
+        )
+        if is_keyframe:
+            last_keyframe = run.frame_num
+        else:
+            bbox = ImageChops.difference(previous, frame).getbbox()
+            if bbox:
+                left, top, right, bottom = bbox
+                # ANMF offsets are stored halved, so they have to be even
+                left, top = left - left % 2, top - top % 2
+                area = (right - left) * (bottom - top)
+                if area > MAX_PARTIAL_AREA * frame.width * frame.height:
+                    previous = frame
+                    continue
+                run.frame = frame.crop((left, top, right, bottom))
+                run.key = frame_key(run.frame)
+                run.x, run.y = left, top
+        previous = frame
+    return runs
+
+
+def encoding_key() -> str:
+    """The encoder settings that change the bytes of a rendered clip."""
+    return f"keyframes {KEYFRAME_INTERVAL} swap {SWAP_PALETTE}"
+
+
+def plan_frames(frames, keyframe_interval: Optional[int] = None) -> list[FrameRun]:
+    keyframe_interval = keyframe_interval or KEYFRAME_INTERVAL
+    return delta_frames(collapse_frames(frames), keyframe_interval)
+
+
+def render(
+    frames,
+    file_path,
+    encoder: Optional[str] = None,
+    cache: Optional[FrameCache] = None,
+    keyframe_interval: Optional[int] = None,
+) -> bool:
+    encoder = encoder or ENCODER
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder {encoder}")
+    runs = plan_frames(frames, keyframe_interval)
+    if not runs:
+        return False
+    ENCODERS[encoder](runs, file_path, cache or FrameCache())
+    return True
+
+
+def encoding_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    The process pool every render_all() call shares, started on first use.
+
+    The checks render concurrently, so a single pool keeps encoding to
+    RENDER_WORKERS processes in total. Workers come from a forkserver instead
+    of forking this multi-threaded process, and set up Django themselves since
+    importing pushbyt.animation needs the app registry.
+    """
+    global _pool
+    if RENDER_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _pool = ProcessPoolExecutor(
+                RENDER_WORKERS, mp_context=context, initializer=django.setup
+            )
+        return _pool
+
+
+def discard_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next render starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def render_all(
+    clips,
+    encoder: Optional[str] = None,
+    cache: Optional[FrameCache] = None,
+    keyframe_interval: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> list[bool]:
+    """
+    Render (frames, file_path) clips as they arrive from an iterable.
+
+    With more than one worker, each clip's new frames go to the shared
+    encoding pool as raw bytes as soon as the clip is planned, and clips are
+    muxed in order once their frames are back. At most `workers` clips are in
+    flight, so the caller can keep producing the next clip meanwhile. Falls
+    back to encoding serially with one worker or if the pool can't be used.
+    """
+    encoder = encoder or ENCODER
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder {encoder}")
+    cache = cache or FrameCache()
+    workers = RENDER_WORKERS if workers is None else workers
+    results = []
+    in_flight = deque()
+
+    def finish_clip():
+        runs, file_path = in_flight.popleft()
+        if runs:
+            ENCODERS[encoder](runs, file_path, cache)
+        results.append(bool(runs))
+
+    executor = encoding_pool() if workers > 1 else None
+    for frames, file_path in clips:
+        runs = plan_frames(frames, keyframe_interval)
+        if executor:
+            try:
+                cache.submit(runs, executor)
+            # RuntimeError: another render already shut the broken pool down
+            except (OSError, RuntimeError, BrokenProcessPool) as e:
+                logger.warning(f"Parallel encoding failed, encoding serially: {e}")
+                discard_pool(executor)
+                executor = None
+        in_flight.append((runs, file_path))
+        while len(in_flight) > (workers if executor else 0):
+            finish_clip()
+    while in_flight:
+        finish_clip()
+    return results
+
+
+def render_mux(runs: list[FrameRun], file_path, cache: FrameCache):
+    Path(file_path).write_bytes(mux(runs, cache))
+
+
+def render_webpmux(runs: list[FrameRun], file_path, cache: FrameCache):
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_path = Path(temp_dir)
-        in_files = [
-            convert_frame(temp_path, i, frame) for i, frame in enumerate(frames)
-        ]
-        if not in_files:
-            return False
         frames_arg = " ".join(
-            f"-frame {tf} +{FRAME_TIME.total_seconds() * 1000}" for tf in in_files
+            f"-frame {convert_frame(temp_path, run, cache)}"
+            + f" +{run.duration}+{run.x}+{run.y}"
+            for run in runs
         )
         cmd = f"webpmux {frames_arg} -loop 1 -bgcolor 255,255,255,255 -o {file_path}"
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode != 0:
             raise RuntimeError(result.stderr)
-        return True
 
 
-def convert_frame(frame_dir: Path, frame_num: int, frame: Image.Image) -> Path:
-    frame_file = frame_dir / f"frame{frame_num:04d}.webp"
+ENCODERS = {"mux": render_mux, "webpmux": render_webpmux}
+
+
+def encode(
+    frames,
+    cache: Optional[FrameCache] = None,
+    keyframe_interval: Optional[int] = None,
+) -> Optional[bytes]:
+    """Encode frames into animated WebP bytes without touching the disk."""
+    runs = plan_frames(frames, keyframe_interval)
+    if not runs:
+        return None
+    return mux(runs, cache or FrameCache())
+
+
+def mux(runs: list[FrameRun], cache: FrameCache) -> bytes:
+    encoded = [
+        webp.Frame(
+            cache.encode(run.frame_num, run.frame, run.key),
+            *run.frame.size,
+            run.duration,
+            run.x,
+            run.y,
+        )
+        for run in runs
+    ]
+    size = (
+        max(f.x + f.width for f in encoded),
+        max(f.y + f.height for f in encoded),
+    )
+    return webp.assemble(encoded, size, loop=1, background=(255, 255, 255, 255))
+
+
+def convert_frame(frame_dir: Path, run: FrameRun, cache: FrameCache) -> Path:
+    frame_file = frame_dir / f"frame{run.frame_num:04d}.webp"
+    frame_file.write_bytes(cache.encode(run.frame_num, run.frame, run.key))
+    return frame_file
+
+
+def encode_batch(raw_frames) -> list[bytes]:
+    return [
+        encode_frame(frame_num, Image.frombytes(mode, size, data))
+        for frame_num, mode, size, data in raw_frames
+    ]
+
+
+def encode_frame(frame_num: int, frame: Image.Image) -> bytes:
     if SWAP_PALETTE:
         frame = swap_palette(frame)
+    output = BytesIO()
     try:
-        frame.save(frame_file, "WebP", quality=100)
-        return frame_file
+        frame.save(output, "WebP", quality=100)
+        return output.getvalue()
     except Exception as e:
         logging.error(f"Error encoding frame {frame_num}: {e}")
         logging.error(f"Frame size: {frame.size}, Frame mode: {frame.mode}")
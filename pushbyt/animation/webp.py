@@ -0,0 +1,97 @@
+import struct
+from dataclasses import dataclass
+from typing import Iterator, Sequence, Tuple
+
+
+# Chunks from a still WebP that carry the actual image data. Everything else
+# (VP8X, ICCP, EXIF, XMP) describes the still image and is dropped when the
+# frame is wrapped in an ANMF chunk.
+IMAGE_CHUNKS = {b"ALPH", b"VP8 ", b"VP8L"}
+
+ANIMATION_FLAG = 0x02
+ALPHA_FLAG = 0x10
+# The alpha_is_used bit of a VP8L header, after its signature byte
+VP8L_ALPHA_BIT = 1 << 28
+
+
+@dataclass(frozen=True)
+class Frame:
+    data: bytes  # an encoded still WebP
+    width: int
+    height: int
+    duration: int  # milliseconds
+    x: int = 0
+    y: int = 0
+
+
+def iter_chunks(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    if data[:4] != b"RIFF" or data[8:12] != b"WEBP":
+        raise ValueError("Not a WebP file")
+    pos = 12
+    while pos + 8 <= len(data):
+        fourcc = data[pos : pos + 4]
+        (size,) = struct.unpack_from("<I", data, pos + 4)
+        yield fourcc, data[pos + 8 : pos + 8 + size]
+        pos += 8 + size + (size & 1)
+
+
+def chunk(fourcc: bytes, payload: bytes) -> bytes:
+    header = fourcc + struct.pack("<I", len(payload))
+    padding = b"\0" if len(payload) & 1 else b""
+    return header + payload + padding
+
+
+def chunk_has_alpha(fourcc: bytes, payload: bytes) -> bool:
+    """Whether an image chunk carries transparency, for the VP8X alpha flag."""
+    if fourcc == b"ALPH":
+        return True
+    if fourcc == b"VP8L":
+        return bool(int.from_bytes(payload[1:5], "little") & VP8L_ALPHA_BIT)
+    return False
+
+
+def uint24(n: int) -> bytes:
+    return n.to_bytes(3, "little")
+
+
+def assemble(
+    frames: Sequence[Frame],
+    size: Tuple[int, int],
+    loop: int = 1,
+    background: Tuple[int, int, int, int] = (255, 255, 255, 255),
+) -> bytes:
+    """
+    Mux encoded still frames into an animated WebP, like `webpmux -frame ...`.
+
+    Frames are neither blended differently nor disposed, which matches the
+    webpmux defaults. Offsets must be even, as required by the ANMF chunk.
+    """
+    width, height = size
+    has_alpha = False
+    body = []
+    for frame in frames:
+        if frame.x % 2 or frame.y % 2:
+            raise ValueError(f"Frame offset must be even, got {frame.x},{frame.y}")
+        image_data = []
+        for fourcc, payload in iter_chunks(frame.data):
+            if fourcc in IMAGE_CHUNKS:
+                has_alpha |= chunk_has_alpha(fourcc, payload)
+                image_data.append(chunk(fourcc, payload))
+        header = b"".join(
+            [
+                uint24(frame.x // 2),
+                uint24(frame.y // 2),
+                uint24(frame.width - 1),
+                uint24(frame.height - 1),
+                uint24(frame.duration),
+                b"\0",  # blend with the previous frame, no disposal
+            ]
+        )
+        body.append(chunk(b"ANMF", header + b"".join(image_data)))
+
+    flags = ANIMATION_FLAG | (ALPHA_FLAG if has_alpha else 0)
+    vp8x = bytes([flags, 0, 0, 0]) + uint24(width - 1) + uint24(height - 1)
+    r, g, b, a = background
+    anim = bytes([b, g, r, a]) + struct.pack("<H", loop)
+    riff = chunk(b"VP8X", vp8x) + chunk(b"ANIM", anim) + b"".join(body)
+    return b"RIFF" + struct.pack("<I", 4 + len(riff)) + b"WEBP" + riff
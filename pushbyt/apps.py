@@ -10,13 +10,22 @@ class PushbytConfig(AppConfig):
     name = "pushbyt"
 
     def ready(self):
-        """Clear any stale locks when the application starts."""
+        """Load fonts and clear any stale locks when the application starts."""
         # Only run once per process (not during migrations or management commands)
         import sys
 
         if "runserver" not in sys.argv and "gunicorn" not in sys.argv[0]:
             return
 
+        # With gunicorn --preload this runs in the master, so every worker
+        # shares the loaded fonts and timer digits instead of building them on the
+        # render path
+        from pushbyt.animation import preload_fonts
+        from pushbyt.animation.timer import digit_transitions
+
+        preload_fonts()
+        digit_transitions()
+
         # Use a thread with a small delay to avoid database access during app init
         # This prevents Django's "database access during initialization" warning
         def clear_locks_delayed():
@@ -0,0 +1,589 @@
+"""The pre-optimization implementations and the fixtures they're compared on."""
+
+from pushbyt.animation import FRAME_TIME
+from pushbyt.animation import fonts, radar, rays2
+from pushbyt.animation import timer as timer_module
+from pushbyt.animation.fonts import get_atlas, get_font
+from pushbyt.animation.radar import clock_radar
+from pushbyt.animation.rays2 import clock_rays
+from pushbyt.animation import song
+from pushbyt.animation.song import song_frames
+from pushbyt.benchmarks.tracks import TRACKS
+from pushbyt.animation.timer import timer
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import islice
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageOps
+from unidecode import unidecode
+import math
+import random
+import textwrap
+
+
+WIDTH, HEIGHT = 64, 32
+FRAME_COUNT = 150
+
+
+def clock_frames(generator, count=FRAME_COUNT):
+    t = datetime(2024, 1, 1, 10, 59, 50)
+    next(generator)
+    frames = []
+    for _ in range(count):
+        frames.append(generator.send(t))
+        t += FRAME_TIME
+    return frames
+
+
+def doorbell_frames(count=FRAME_COUNT):
+    door, bell, bellhop = [
+        Image.open(f"static/{f}.png") for f in ["door", "bell", "bellhop"]
+    ]
+    frame_base = Image.new("RGB", (WIDTH, HEIGHT), "black")
+    frame_base.paste(bell, (0, 0))
+    frame_base.paste(bellhop, (32, 0))
+    frames = []
+    for i in range(count):
+        frame = frame_base.copy()
+        frame.paste(door, (i % 64 - door.width, 1))
+        frames.append(frame)
+    return frames
+
+
+def sample_art():
+    """Stand-in 64x64 album cover so benchmarks don't need the network."""
+    gradient = Image.radial_gradient("L").resize((64, 64))
+    return Image.merge(
+        "RGB", (gradient, gradient.rotate(90), ImageOps.invert(gradient))
+    )
+
+
+def sample_covers():
+    """Stand-in covers of the sizes and kinds get_dominant_color sees."""
+    rng = random.Random(20)
+    noise = Image.frombytes("RGB", (64, 64), rng.randbytes(64 * 64 * 3))
+    dark = Image.new("RGB", (64, 64), (20, 30, 40))
+    blocks = Image.new("RGB", (64, 64), "black")
+    for i, color in enumerate(["red", "lime", "blue", "white"]):
+        blocks.paste(color, (i * 16, 0, i * 16 + 16, 64))
+    return {
+        "gradient": sample_art(),
+        "gradient 640x640": sample_art().resize((640, 640), Image.BICUBIC),
+        "noise": noise,
+        "noise 300x300": noise.resize((300, 300), Image.NEAREST),
+        "dark": dark,
+        "blocks": blocks,
+    }
+
+
+def sample_frames():
+    """Representative 15 second clips for each animation source."""
+    return {
+        "radar": clock_frames(
+            clock_radar(datetime(2024, 1, 1, 10, 59, 50), random.Random(0))
+        ),
+        "rays": clock_frames(clock_rays(random.Random(0))),
+        "timer": list(islice(timer(timedelta(minutes=1, seconds=5)), FRAME_COUNT)),
+        "spotify": list(
+            song_frames(TRACKS[0]["title"], TRACKS[0]["artist"], sample_art())
+        ),
+        "doorbell": doorbell_frames(),
+    }
+
+
+# Baselines: the per-pixel implementations that were vectorized, kept so the
+# benchmarks (and tests) can compare against them.
+
+
+def baseline_background(background):
+    image = Image.new("RGB", (background.width, background.height))
+    pixels = image.load()
+    max_distance = math.sqrt(background.center_x**2 + background.center_y**2)
+
+    for y in range(background.height):
+        for x in range(background.width):
+            distance = math.sqrt(
+                (x - background.center_x) ** 2 + (y - background.center_y) ** 2
+            )
+            normalized_distance = distance / max_distance
+            pixels[x, y] = tuple(
+                int(c + (e - c) * normalized_distance)
+                for c, e in zip(background.center_color, background.edge_color)
+            )
+
+    return image
+
+
+def baseline_transform_ray(ray_image, time_image):
+    ray_pixels = ray_image.load()
+    time_pixels = time_image.load()
+
+    non_opaque_pixels = [
+        (x, y) for x in range(WIDTH) for y in range(HEIGHT) if ray_pixels[x, y] != 0
+    ]
+    distances = [
+        math.sqrt((x - WIDTH // 2) ** 2 + (y - HEIGHT // 2) ** 2)
+        for x, y in non_opaque_pixels
+    ]
+    sorted_pixels = [pixel for _, pixel in sorted(zip(distances, non_opaque_pixels))]
+
+    new_ray_image = Image.new("L", ray_image.size, color=0)
+    step = 0
+    for x, y in sorted_pixels:
+        if time_pixels[x, y] != 0:
+            step += ray_pixels[x, y] * 0.1
+        c = max(0, ray_pixels[x, y] - int(step))
+        new_ray_image.putpixel((x, y), c)
+
+    return new_ray_image
+
+
+def baseline_time_img(font, text):
+    image = Image.new("L", (32, 32), color=0)
+    ImageDraw.Draw(image).text((0, 0), text, font=font, fill="white")
+
+    pixels = image.load()
+    non_transparent_pixels = [
+        (x, y) for x in range(32) for y in range(32) if pixels[x, y] != 0
+    ]
+    if not non_transparent_pixels:
+        return image
+
+    x_coords, y_coords = zip(*non_transparent_pixels)
+    center_x = (min(x_coords) + max(x_coords)) // 2
+    center_y = (min(y_coords) + max(y_coords)) // 2
+
+    result = Image.new("L", (32, 32), color=0)
+    result.paste(image, (16 - center_x, 16 - center_y))
+    return result
+
+
+def baseline_compose_time_img(font, t):
+    time_image = Image.new("L", (WIDTH, HEIGHT), color="black")
+    time_image.paste(baseline_time_img(font, t.strftime("%l").rjust(2)), box=(0, 0))
+    time_image.paste(baseline_time_img(font, t.strftime("%M")), box=(32, 0))
+    return time_image
+
+
+def baseline_time_pixels(time_str):
+    image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
+    font = ImageFont.truetype("./fonts/pixel12x10/Pixel12x10-v1.1.0.ttf", 16)
+    draw = ImageDraw.Draw(image)
+    left, top, right, bottom = draw.textbbox((0, 0), time_str, font=font)
+    new_left = (WIDTH - (right - left)) // 2
+    new_top = (HEIGHT - (bottom - top)) // 2
+    draw.text((new_left, new_top), time_str, font=font, fill="white")
+    pixels = image.load()
+    return [
+        (x, y) for x in range(WIDTH) for y in range(HEIGHT) if pixels[x, y] != (0, 0, 0)
+    ]
+
+
+def baseline_digit_image(c, font):
+    image = Image.new("RGB", (timer_module.DIGIT_WIDTH, timer_module.DIGIT_HEIGHT))
+    ImageDraw.Draw(image).text(
+        (timer_module.DIGIT_WIDTH // 2, 0), c, fill="white", anchor="mt", font=font
+    )
+    return image
+
+
+def baseline_combine_digits(font, sub_second, old_digit, new_digit):
+    old_img = baseline_digit_image(old_digit, font)
+    if sub_second > 7 or old_digit == new_digit:
+        return old_img
+
+    step = 7 - sub_second
+    new_img = baseline_digit_image(new_digit, font)
+    oldp = old_img.load()
+    newp = new_img.load()
+    mid = timer_module.DIGIT_HEIGHT // 2
+    top = mid - step
+    bot = mid + step
+    compo_img = Image.new("RGB", old_img.size, "black")
+    for x in range(timer_module.DIGIT_WIDTH):
+        for y in range(timer_module.DIGIT_HEIGHT):
+            if y == top or y == bot:
+                inold = oldp[x, y] != (0, 0, 0)
+                innew = newp[x, y] != (0, 0, 0)
+                if inold and innew:
+                    compo_img.putpixel((x, y), (255, 255, 255))
+                elif inold and not innew:
+                    compo_img.putpixel((x, y), (255, 0, 0))
+                elif innew and not inold:
+                    compo_img.putpixel((x, y), (0, 255, 0))
+            elif y < top or y > bot:
+                compo_img.putpixel((x, y), oldp[x, y])
+            else:
+                compo_img.putpixel((x, y), newp[x, y])
+    return compo_img
+
+
+def baseline_timer(delta):
+    font = get_font(*fonts.UPHEAVAL)
+    td = delta
+    while td > -timedelta(seconds=10):
+        sub_second = td.microseconds // FRAME_TIME.microseconds
+        if td > timedelta(seconds=0):
+            current_digits = timer_module.to_min_sec(td)
+            next_digits = timer_module.to_min_sec(td - timedelta(seconds=1))
+            digit_images = [
+                baseline_combine_digits(font, sub_second, c, n)
+                for c, n in zip(current_digits, next_digits)
+            ]
+            yield timer_module.text_image(digit_images, sub_second)
+        else:
+            color = "red" if sub_second % 2 == 1 else "black"
+            yield Image.new("RGB", (WIDTH, HEIGHT), color)
+        td -= FRAME_TIME
+
+
+def baseline_screen_img(fade, text_img, art_img):
+    def step_color(pixel, amount):
+        def step(c):
+            return max(0, min(255, c + round(amount)))
+
+        r, g, b = pixel
+        return step(r), step(g), step(b)
+
+    processed_image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
+    text_pixels = text_img.load()
+    art_pixels = art_img.load()
+    for x in range(WIDTH):
+        for y in range(HEIGHT):
+            step = 200 if text_pixels[x, y] != (0, 0, 0) else -180
+            processed_image.putpixel((x, y), step_color(art_pixels[x, y], step * fade))
+    return processed_image
+
+
+def baseline_dominant_color(image):
+    pixels = image.load()
+    width, height = image.size
+
+    color_count = defaultdict(int)
+
+    for x in range(width):
+        for y in range(height):
+            color = pixels[x, y]
+            quantized_color = tuple(int(channel / 10) for channel in color)
+            if sum(quantized_color) > 8:
+                color_count[quantized_color] += 1
+
+    if color_count:
+        dominant_color = max(color_count, key=color_count.get)
+        return tuple(channel * 10 for channel in dominant_color)
+    else:
+        return (255, 255, 255)
+
+
+def baseline_gen_album_art(art, dominant_color=None):
+    tiled_img = Image.new(
+        "RGB", (WIDTH, song.ART_HEIGHT * 2 + song.BORDER_HEIGHT), color="black"
+    )
+    tiled_img.paste(art, (0, 0))
+    tiled_img.paste(art, (0, song.ART_HEIGHT + song.BORDER_HEIGHT))
+    dominant_color = dominant_color or song.get_dominant_color(art)
+    border = baseline_gen_art_border(dominant_color)
+    while True:
+        for top in range(0, song.ART_HEIGHT + 3):
+            frame = tiled_img.copy()
+            border_frame = next(border)
+            frame.paste(border_frame, (0, 64))
+            yield frame.crop((0, top, WIDTH, top + HEIGHT))
+
+
+def baseline_gen_art_border(color):
+    diamonds = Image.new("RGB", (68, 3), color="black")
+    draw = ImageDraw.Draw(diamonds)
+    reverse_dir = False
+
+    for x in range(0, 68, 4):
+        draw.polygon([(x, 1), (x + 1, 0), (x + 2, 1), (x + 1, 2)], fill=color)
+
+    while True:
+        reverse_dir = not reverse_dir
+        for _ in range(4):
+            for x in range(4):
+                if reverse_dir:
+                    x = 4 - x
+                yield diamonds.crop((x, 0, 64 + x, 3))
+
+
+def baseline_gen_text(text, atlas, step_count):
+    FONT_WRAP_WIDTH = 12
+    wrapped_title = textwrap.wrap(unidecode(text), width=FONT_WRAP_WIDTH)
+    title_img = song.text_image(wrapped_title, atlas)
+    _, title_height = title_img.size
+    needs_scroll = title_height > HEIGHT
+
+    for i in range(step_count):
+        if needs_scroll:
+            title_overhang = step_count - (title_height - HEIGHT)
+            title_y = min(title_height - HEIGHT, max(0, i - title_overhang // 2))
+        else:
+            title_y = title_height // 2 - 16
+        yield title_img.crop((0, title_y, WIDTH, title_y + HEIGHT))
+
+
+def baseline_song_frames(title, artist, art, dominant_color=None):
+    atlas = get_atlas(*fonts.PIXELMIX)
+    art_scroll = baseline_gen_album_art(art, dominant_color)
+    for _ in range(10):
+        yield next(art_scroll)
+    title_scroll = baseline_gen_text(title, atlas, 50)
+    artist_scroll = baseline_gen_text(artist, atlas, 51)
+
+    black_img = Image.new("RGB", (WIDTH, HEIGHT), color="black")
+    for i in range(50):
+        title_img = next(title_scroll)
+        art_img = next(art_scroll)
+        fade = min(1, i / 25)
+        yield song.screen_img(fade, title_img, art_img)
+
+    artist_img = next(artist_scroll)
+    for i in range(15):
+        art_img = next(art_scroll)
+        perc = i / 15
+        processed_title = song.screen_img(1, title_img, art_img)
+        processed_artist = song.screen_img(1, artist_img, art_img)
+        faded_title = Image.blend(black_img, processed_title, 1 - perc)
+        faded_artist = Image.blend(black_img, processed_artist, perc)
+        yield ImageChops.lighter(faded_title, faded_artist)
+
+    for i in range(50):
+        artist_img = next(artist_scroll)
+        art_img = next(art_scroll)
+        yield song.screen_img(1 - i / 50, artist_img, art_img)
+
+    for i in range(25):
+        art_img = next(art_scroll)
+        yield Image.blend(black_img, art_img, 1 - i / 25)
+
+
+RAYS_SCALE = 4
+RAYS_SCALED_WIDTH, RAYS_SCALED_HEIGHT = RAYS_SCALE * WIDTH, RAYS_SCALE * HEIGHT
+
+
+@dataclass(frozen=True)
+class BaselinePoint:
+    x: float
+    y: float
+
+    def to_tuple(self):
+        return (self.x, self.y)
+
+
+RAYS_CENTER = BaselinePoint(RAYS_SCALED_WIDTH / 2, RAYS_SCALED_HEIGHT / 2)
+
+
+@dataclass
+class BaselineRay:
+    angle: float
+    _start: float = 0.0
+    _end: float = 0.01
+    color = (255, 150, 150)
+
+    def to_line(self):
+        return [self.start.to_tuple(), self.end.to_tuple()]
+
+    def is_in_bounds(self):
+        return (
+            self.start.x >= 0
+            and self.start.x < RAYS_SCALED_WIDTH
+            and self.start.y >= 0
+            and self.start.y < RAYS_SCALED_HEIGHT
+        )
+
+    def animate(self):
+        self._start += 0.04
+        self._end += 0.06
+        self.color = baseline_combine_colors(self.color, (-10, 0, 10))
+
+    @property
+    def start(self):
+        return self._to_point(self._start)
+
+    @property
+    def end(self):
+        return self._to_point(self._end)
+
+    def _to_point(self, percent):
+        x = RAYS_CENTER.x + RAYS_SCALED_WIDTH * percent * math.cos(self.angle)
+        y = RAYS_CENTER.y + RAYS_SCALED_WIDTH * percent * math.sin(self.angle)
+        return BaselinePoint(x, y)
+
+
+def baseline_combine_colors(aa, bb):
+    return tuple(max(0, min(255, a + b)) for a, b in zip(aa, bb))
+
+
+def baseline_draw_rays(rays):
+    image = Image.new("RGB", (RAYS_SCALED_WIDTH, RAYS_SCALED_HEIGHT), color="black")
+    draw = ImageDraw.Draw(image)
+    for ray in rays:
+        draw.line(ray.to_line(), fill=ray.color, width=RAYS_SCALE)
+    return image.resize((WIDTH, HEIGHT), resample=Image.LANCZOS)
+
+
+def baseline_clock_rays(rng):
+    rays = []
+    black_image = Image.new("RGB", (WIDTH, HEIGHT), color="black")
+    time_image = black_image.copy()
+    next_frame = black_image
+    while True:
+        t = yield next_frame
+        all_time_pixels = rays2.get_time_pixels(t.strftime("%-I:%M"))
+        for _ in range(rng.randint(1, 4)):
+            rays.append(BaselineRay(rng.uniform(0, 2 * math.pi)))
+
+        image_lo = baseline_draw_rays(rays)
+        for ray in rays:
+            ray.animate()
+        image_pixels = image_lo.load()
+        time_pixels = time_image.load()
+        for x, y in all_time_pixels:
+            time_image.putpixel(
+                (x, y), baseline_combine_colors(image_pixels[x, y], time_pixels[x, y])
+            )
+
+        next_frame = ImageChops.screen(image_lo, time_image)
+        time_image = Image.blend(time_image, black_image, alpha=0.04)
+        rays = [ray for ray in rays if ray.is_in_bounds()]
+
+
+class BaselineSecondHand(radar.SecondHand):
+    @dataclass
+    class Pixel:
+        color = (0, 0, 0)
+        alpha = 0
+        target_alpha = 0
+
+        def activate(self, color, alpha):
+            self.color = color
+            if alpha > self.target_alpha:
+                self.target_alpha = alpha
+                self.alpha = alpha
+
+        def step(self):
+            fade_rate = self.target_alpha / 30.0
+            if self.target_alpha > 0 and self.alpha > 0:
+                self.alpha = max(0, self.alpha - fade_rate)
+            return (*self.color, int(self.alpha))
+
+    def __init__(self):
+        super().__init__()
+        self.pixels = defaultdict(BaselineSecondHand.Pixel)
+
+    def compose_ray(self, timediff, ray_angle, bg_image):
+        second_hand_angle = radar.datetime_to_radian(timediff, 60)
+        dot_img = self.get_dot_img(second_hand_angle)
+
+        center_x, center_y = radar.SCALED_WIDTH // 2, radar.SCALED_HEIGHT // 2
+        length = max(radar.SCALED_WIDTH, radar.SCALED_HEIGHT) * 2
+        end_x = center_x + int(length * math.sin(ray_angle))
+        end_y = center_y - int(length * math.cos(ray_angle))
+
+        ray_data = radar.ray_mask(end_x, end_y).getdata()
+        dot_data = dot_img.getdata()
+
+        for y in range(HEIGHT):
+            for x in range(WIDTH):
+                index = y * WIDTH + x
+                if ray_data[index] > 20 and dot_data[index] > 0:
+                    self.pixels[(x, y)].activate((255, 0, 0), dot_data[index])
+
+        self.last_ray_angle = ray_angle
+
+        img = Image.new("RGBA", (WIDTH, HEIGHT), color=(0, 0, 0, 0))
+        for pos, pixel in list(self.pixels.items()):
+            color_with_alpha = pixel.step()
+            if color_with_alpha[3] > 0:
+                img.putpixel(pos, color_with_alpha)
+            else:
+                del self.pixels[pos]
+        return img
+
+
+class BaselineTimePixels(radar.TimePixels):
+    @dataclass
+    class Pixel:
+        alpha = 0.0
+        velocity = 0.0
+        color = (0, 0, 0)
+
+        def step(self):
+            alpha = max(0.0, self.alpha + self.velocity)
+            if alpha > 1.0:
+                alpha = 1.0
+                self.velocity = -0.01
+            self.alpha = alpha
+            return tuple(int(c * self.alpha) for c in self.color)
+
+    def __init__(self):
+        self.pixels = defaultdict(BaselineTimePixels.Pixel)
+
+    def zap_with_ray(self, time_image, ray_image, bg_image):
+        ray_pixels = ray_image.load()
+        time_image_pixels = time_image.load()
+        bg_pixels = bg_image.load()
+        for x in range(WIDTH):
+            for y in range(HEIGHT):
+                if ray_pixels[x, y] > 15 and time_image_pixels[x, y]:
+                    pxl = self.pixels[x, y]
+                    pxl.velocity = 0.18
+                    pxl.color = bg_pixels[x, y]
+        img = Image.new("RGB", (WIDTH, HEIGHT), color="black")
+        for point, px in self.pixels.items():
+            img.putpixel(point, px.step())
+        return img
+
+
+def radar_frames(count, baseline=False):
+    """Render radar frames, optionally with the per-pixel particle state."""
+    start = datetime(2024, 1, 1, 10, 59, 50)
+    renderer = radar.Renderer(get_atlas(*fonts.DEPARTURE_MONO), start, random.Random(0))
+    if baseline:
+        renderer.second_hand = BaselineSecondHand()
+        renderer.time_pixels = BaselineTimePixels()
+    return [renderer.render_frame(start + FRAME_TIME * i) for i in range(count)]
+
+
+def ray_sweep():
+    """(ray, time) image pairs for one 9 s radar sweep over the digits."""
+    atlas = get_atlas(*fonts.DEPARTURE_MONO)
+    time_image = radar.compose_time_img(atlas, datetime(2024, 1, 1, 10, 58))
+    return [
+        (radar.get_ray_image(radar.datetime_to_radian(FRAME_TIME * i, 9)), time_image)
+        for i in range(90)
+    ]
+
+
+def screen_inputs(track):
+    """(fade, text, art) for every screen_img call of a song's text section."""
+    atlas = get_atlas(*fonts.PIXELMIX)
+    art_scroll = song.gen_album_art(sample_art())
+    title_scroll = song.gen_text(track["title"], atlas, 50)
+    artist_scroll = song.gen_text(track["artist"], atlas, 51)
+    inputs = [(min(1, i / 25), next(title_scroll), next(art_scroll)) for i in range(50)]
+    title_img, artist_img = inputs[-1][1], next(artist_scroll)
+    for i in range(15):
+        art_img = next(art_scroll)
+        inputs += [(1, title_img, art_img), (1, artist_img, art_img)]
+    inputs += [(1 - i / 50, next(artist_scroll), next(art_scroll)) for i in range(50)]
+    return inputs
+
+
+def ray_fields(count):
+    """The same `count` rays at random ages, as baseline objects and a RayField."""
+    rng = random.Random(count)
+    baseline = []
+    field = rays2.RayField()
+    for _ in range(count):
+        angle, age = rng.uniform(0, 2 * math.pi), rng.randrange(8)
+        ray = BaselineRay(angle)
+        field.add([angle])
+        for _ in range(age):
+            ray.animate()
+        baseline.append(ray)
+        field.start[-1], field.end[-1] = ray._start, ray._end
+        field.color[-1] = ray.color
+    return baseline, field
@@ -0,0 +1,28 @@
+"""Sample tracks to render songs from, including some long titles."""
+
+TRACKS = [
+    {
+        "title": "Too Much Brandy",
+        "artist": "The Streets",
+        "art": "https://i.scdn.co/image/ab67616d00004851b35c6da432ec9a1a2f2df1af",
+        "id": 1,
+    },
+    {
+        "id": 2,
+        "title": "420",
+        "artist": "STS, RJD2",
+        "art": "https://i.scdn.co/image/ab67616d0000485127c7bcadf68b3feec0829b1b",
+    },
+    {
+        "id": "3",
+        "title": "Modern Girl",
+        "artist": "Bleachers",
+        "art": "https://i.scdn.co/image/ab67616d000048518acf3fbdae4c4a93992b59a7",
+    },
+    {
+        "id": "4",
+        "title": "Heart Of Glass Reart for Fass Bing Too Tass",
+        "artist": "Blondie Fondie Rondi Jongdi Boolongi",
+        "art": "https://i.scdn.co/image/ab67616d00004851ace2bedb8e6cfa04207d5c0f",
+    },
+]
@@ -0,0 +1,432 @@
+from django_rich.management import RichCommand
+from rich.table import Table
+from pushbyt.animation import FRAME_TIME
+from pushbyt.animation import util
+from pushbyt.animation import fonts, radar, rays2
+from pushbyt.animation import timer as timer_module
+from pushbyt.animation.fonts import get_atlas, get_font
+from pushbyt.animation.art_cache import ArtCache
+from pushbyt.animation.text import GlyphAtlas
+from pushbyt.animation.rays2 import clock_rays
+from pushbyt.animation import song
+from pushbyt.benchmarks.tracks import TRACKS
+from pushbyt.benchmarks.baselines import (
+    FRAME_COUNT,
+    HEIGHT,
+    WIDTH,
+    baseline_background,
+    baseline_clock_rays,
+    baseline_compose_time_img,
+    baseline_dominant_color,
+    baseline_draw_rays,
+    baseline_gen_album_art,
+    baseline_screen_img,
+    baseline_song_frames,
+    baseline_time_pixels,
+    baseline_timer,
+    baseline_transform_ray,
+    clock_frames,
+    radar_frames,
+    ray_fields,
+    ray_sweep,
+    sample_art,
+    sample_covers,
+    sample_frames,
+    screen_inputs,
+)
+from pushbyt.animation.timer import timer
+from pathlib import Path
+from datetime import datetime, timedelta
+from itertools import islice
+from PIL import Image, ImageDraw
+import random
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_encoder(command, options):
+    encoders = [
+        name
+        for name in util.ENCODERS
+        if name != "webpmux" or shutil.which("webpmux") is not None
+    ]
+    table = Table(title="Animated WebP encoders (best of %d)" % options["repeat"])
+    table.add_column("Source", style="cyan")
+    for name in encoders:
+        table.add_column(f"{name} ms", justify="right")
+        table.add_column(f"{name} bytes", justify="right")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for source, frames in sample_frames().items():
+            row = [source]
+            for name in encoders:
+                file_path = Path(temp_dir) / f"{source}-{name}.webp"
+                elapsed, _ = timed(
+                    lambda: util.render(frames, file_path, encoder=name),
+                    options["repeat"],
+                )
+                row += [f"{elapsed * 1000:.1f}", str(file_path.stat().st_size)]
+            table.add_row(*row)
+    return table
+
+
+def bench_delta(command, options):
+    table = Table(title="Partial frames vs keyframes (best of %d)" % options["repeat"])
+    table.add_column("Source", style="cyan")
+    table.add_column("keyframes bytes", justify="right")
+    table.add_column("partial bytes", justify="right")
+    table.add_column("bytes saved", justify="right")
+    table.add_column("keyframes ms", justify="right")
+    table.add_column("partial ms", justify="right")
+
+    for source, frames in sample_frames().items():
+        results = [
+            timed(
+                lambda: util.encode(frames, keyframe_interval=interval),
+                options["repeat"],
+            )
+            for interval in [1, util.KEYFRAME_INTERVAL]
+        ]
+        (full_time, full), (partial_time, partial) = results
+        table.add_row(
+            source,
+            str(len(full)),
+            str(len(partial)),
+            f"{1 - len(partial) / len(full):.0%}",
+            f"{full_time * 1000:.1f}",
+            f"{partial_time * 1000:.1f}",
+        )
+    return table
+
+
+def bench_slices(command, options):
+    """Encode one segment's overlapping slices serially and in a process pool."""
+    frames = clock_frames(clock_rays(), 1050)
+    table = Table(title="Segment slice encoding (best of %d)" % options["repeat"])
+    table.add_column("Workers", style="cyan")
+    table.add_column("ms", justify="right")
+    table.add_column("Frame cache", justify="right")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        clips = [
+            (frames[i : i + FRAME_COUNT], Path(temp_dir) / f"slice{i}.webp")
+            for i in range(0, len(frames) - FRAME_COUNT + 1, 120)
+        ]
+        for workers in sorted({1, util.RENDER_WORKERS}):
+            caches = []
+
+            def render_segment():
+                caches.append(util.FrameCache())
+                return util.render_all(clips, cache=caches[-1], workers=workers)
+
+            elapsed, _ = timed(render_segment, options["repeat"])
+            table.add_row(str(workers), f"{elapsed * 1000:.1f}", str(caches[-1]))
+    return table
+
+
+def speedup_table(title, rows):
+    """Rows of (name, seconds before, seconds after)."""
+    table = Table(title=title)
+    table.add_column("Benchmark", style="cyan")
+    table.add_column("before ms", justify="right")
+    table.add_column("after ms", justify="right")
+    table.add_column("speedup", justify="right")
+    for name, before, after in rows:
+        table.add_row(
+            name,
+            f"{before * 1000:.3f}",
+            f"{after * 1000:.3f}",
+            f"{before / after:.1f}x",
+        )
+    return table
+
+
+def bench_background(command, options):
+    background = radar.Background(random.Random(0))
+    count = options["repeat"] * 20
+
+    def before():
+        background.shift_colors()
+        baseline_background(background)
+
+    before_time, _ = timed(before, count)
+    after_time, _ = timed(background.render_frame, count)
+    return speedup_table(
+        "radar Background.render_frame (best of %d)" % count,
+        [("render_frame", before_time, after_time)],
+    )
+
+
+def bench_masks(command, options):
+    """One 9 s sweep of radar ray and second-hand masks."""
+    angles = [
+        (
+            radar.datetime_to_radian(FRAME_TIME * i, 9),
+            radar.datetime_to_radian(FRAME_TIME * i, 60),
+        )
+        for i in range(90)
+    ]
+    second_hand = radar.SecondHand()
+
+    def sweep():
+        for ray_angle, dot_angle in angles:
+            radar.get_ray_image(ray_angle)
+            second_hand.get_dot_img(dot_angle)
+
+    def before():
+        radar.ray_mask.cache_clear()
+        radar.dot_mask.cache_clear()
+        sweep()
+
+    before_time, _ = timed(before, options["repeat"])
+    after_time, _ = timed(sweep, options["repeat"])
+    return speedup_table(
+        "radar masks per 90 frame sweep (best of %d)" % options["repeat"],
+        [("ray + dot masks", before_time, after_time)],
+    )
+
+
+def bench_transform_ray(command, options):
+    sweep = ray_sweep()
+    before_time, _ = timed(
+        lambda: [baseline_transform_ray(*images) for images in sweep],
+        options["repeat"],
+    )
+    after_time, _ = timed(
+        lambda: [radar.transform_ray(*images) for images in sweep],
+        options["repeat"],
+    )
+    return speedup_table(
+        "radar transform_ray per 90 frame sweep (best of %d)" % options["repeat"],
+        [("transform_ray", before_time, after_time)],
+    )
+
+
+def bench_time_text(command, options):
+    """Time text for every frame of a 90 s segment that crosses a minute."""
+    font = get_font(*fonts.DEPARTURE_MONO)
+    atlas = get_atlas(*fonts.DEPARTURE_MONO)
+    start = datetime(2024, 1, 1, 10, 59)
+    times = [start + FRAME_TIME * i for i in range(900)]
+
+    def segment(compose_time_img, font, get_time_pixels):
+        for t in times:
+            compose_time_img(font, t)
+            get_time_pixels(t.strftime("%-I:%M"))
+
+    def cached():
+        radar.time_img.cache_clear()
+        rays2.get_time_pixels.cache_clear()
+        segment(radar.compose_time_img, atlas, rays2.get_time_pixels)
+
+    repeat = max(1, options["repeat"] // 5)
+    before_time, _ = timed(
+        lambda: segment(baseline_compose_time_img, font, baseline_time_pixels),
+        repeat,
+    )
+    after_time, _ = timed(cached, repeat)
+    return speedup_table(
+        "Clock time text per 900 frame segment (best of %d)" % repeat,
+        [("radar + rays time text", before_time, after_time)],
+    )
+
+
+def bench_particles(command, options):
+    """Whole radar frames with per-pixel objects vs particle arrays."""
+    count = FRAME_COUNT
+    table = Table(title="radar frames per second (best of %d)" % options["repeat"])
+    table.add_column("Particles", style="cyan")
+    table.add_column("fps", justify="right")
+    for name, baseline in [("per-pixel objects", True), ("arrays", False)]:
+        elapsed, _ = timed(lambda: radar_frames(count, baseline), options["repeat"])
+        table.add_row(name, f"{count / elapsed:.0f}")
+    return table
+
+
+def bench_text(command, options):
+    """Draw the strings each animation draws, through FreeType and the atlas."""
+    samples = [
+        ("timer digits", fonts.UPHEAVAL, list("0123456789"), "mt"),
+        ("song lines", fonts.PIXELMIX, ["Too Much", "Brandy", "The Streets"], "mt"),
+        ("spritz tokens", fonts.PIXELMIX, ["Bak", "i", "ng", "chi", "c", "ken"], "la"),
+        ("radar digits", fonts.DEPARTURE_MONO, ["10", "59", " 9"], "la"),
+        ("rays time", fonts.PIXEL12X10, ["10:59", "9:05"], "la"),
+    ]
+    count = options["repeat"] * 20
+    rows = []
+    for name, spec, texts, anchor in samples:
+        font = get_font(*spec)
+        atlas = GlyphAtlas(font)
+        image = Image.new("RGB", (WIDTH, HEIGHT))
+        draw = ImageDraw.Draw(image)
+
+        def freetype():
+            for text in texts:
+                draw.textbbox((0, 0), text, font=font, anchor=anchor)
+                draw.text((32, 4), text, fill="white", font=font, anchor=anchor)
+
+        def blit():
+            for text in texts:
+                atlas.bbox(text, anchor)
+                atlas.draw(image, (32, 4), text, "white", anchor)
+
+        before_time, _ = timed(freetype, count)
+        after_time, _ = timed(blit, count)
+        rows.append((name, before_time, after_time))
+    return speedup_table("Measure and draw text (best of %d)" % count, rows)
+
+
+def bench_timer(command, options):
+    """One 90 s timer segment, digits rendered per frame vs from the atlas."""
+    delta = timedelta(minutes=10, seconds=30)
+    count = 900
+    repeat = max(1, options["repeat"] // 5)
+    before_time, _ = timed(lambda: list(islice(baseline_timer(delta), count)), repeat)
+    timer_module.digit_transitions.cache_clear()
+    build_time, _ = timed(timer_module.digit_transitions, 1)
+    after_time, _ = timed(lambda: list(islice(timer(delta), count)), repeat)
+    return speedup_table(
+        "Timer frames per 90 s segment (best of %d)" % repeat,
+        [
+            ("segment", before_time, after_time),
+            ("segment incl. building the atlas", before_time, after_time + build_time),
+        ],
+    )
+
+
+def bench_screen(command, options):
+    """song.screen_img over the text section of each `spotify` command track."""
+    rows = []
+    for track in TRACKS:
+        inputs = screen_inputs(track)
+        before_time, _ = timed(
+            lambda: [baseline_screen_img(*args) for args in inputs], options["repeat"]
+        )
+        after_time, _ = timed(
+            lambda: [song.screen_img(*args) for args in inputs], options["repeat"]
+        )
+        rows.append((track["title"], before_time, after_time))
+    return speedup_table(
+        "song.screen_img, %d calls per track (best of %d)"
+        % (len(inputs), options["repeat"]),
+        rows,
+    )
+
+
+def bench_dominant_color(command, options):
+    """song.get_dominant_color on stand-in covers, including oversized ones."""
+    rows = []
+    for name, cover in sample_covers().items():
+        before_time, _ = timed(
+            lambda: baseline_dominant_color(cover), options["repeat"]
+        )
+        after_time, _ = timed(lambda: song.get_dominant_color(cover), options["repeat"])
+        rows.append((name, before_time, after_time))
+    return speedup_table(
+        "song.get_dominant_color (best of %d)" % options["repeat"], rows
+    )
+
+
+def bench_song_info(command, options):
+    """song_info frames per second, with the art served from a local cache."""
+    repeat = options["repeat"]
+    art_url = "https://example.com/sample-art.jpg"
+    art = sample_art()
+    with tempfile.TemporaryDirectory() as directory:
+        art_cache = ArtCache(directory)
+        art_cache.store(art_url, art, song.get_dominant_color(art))
+        with mock.patch.object(song, "ART_CACHE", art_cache):
+
+            def clip():
+                track = TRACKS[0]
+                return list(song.song_info(track["title"], track["artist"], art_url))
+
+            after_time, frames = timed(clip, repeat)
+            with mock.patch.object(song, "song_frames", baseline_song_frames):
+                before_time, _ = timed(clip, repeat)
+    scroll_count = 2 * (song.ART_HEIGHT + song.BORDER_HEIGHT)
+    before_scroll, _ = timed(
+        lambda: list(islice(baseline_gen_album_art(art), scroll_count)), repeat
+    )
+    after_scroll, _ = timed(
+        lambda: list(islice(song.gen_album_art(art), scroll_count)), repeat
+    )
+
+    table = Table(title="Spotify clip rendering (best of %d)" % repeat)
+    table.add_column("Benchmark", style="cyan")
+    table.add_column("frames", justify="right")
+    table.add_column("before fps", justify="right")
+    table.add_column("after fps", justify="right")
+    table.add_column("speedup", justify="right")
+    for name, count, before, after in [
+        ("gen_album_art", scroll_count, before_scroll, after_scroll),
+        ("song_info", len(frames), before_time, after_time),
+    ]:
+        table.add_row(
+            name,
+            str(count),
+            f"{count / before:.0f}",
+            f"{count / after:.0f}",
+            f"{before / after:.1f}x",
+        )
+    return table
+
+
+def bench_rays(command, options):
+    """Frame time of rays2 against the number of rays on screen."""
+    repeat = options["repeat"]
+    rows = []
+    for count in [10, 25, 50, 100, 200]:
+        baseline, field = ray_fields(count)
+        before_time, _ = timed(lambda: baseline_draw_rays(baseline), repeat)
+        after_time, _ = timed(field.draw, repeat)
+        rows.append((f"draw {count} rays", before_time, after_time))
+
+    before_time, _ = timed(
+        lambda: clock_frames(baseline_clock_rays(random.Random(0))), repeat
+    )
+    after_time, _ = timed(lambda: clock_frames(clock_rays(random.Random(0))), repeat)
+    rows.append((f"clock_rays, {FRAME_COUNT} frames", before_time, after_time))
+    return speedup_table("rays2 frame time (best of %d)" % repeat, rows)
+
+
+SUITES = {
+    "encoder": bench_encoder,
+    "delta": bench_delta,
+    "slices": bench_slices,
+    "background": bench_background,
+    "masks": bench_masks,
+    "transform_ray": bench_transform_ray,
+    "particles": bench_particles,
+    "time_text": bench_time_text,
+    "text": bench_text,
+    "timer": bench_timer,
+    "screen": bench_screen,
+    "dominant_color": bench_dominant_color,
+    "song_info": bench_song_info,
+    "rays": bench_rays,
+}
+
+
+class Command(RichCommand):
+    help = "Benchmark animation rendering"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=SUITES.keys())
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.console.print(f"Benchmarking {options['suite']}", style="bold green")
+        self.console.print(SUITES[options["suite"]](self, options))
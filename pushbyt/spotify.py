@@ -9,6 +9,8 @@ import os
 logger = logging.getLogger(__name__)
 
 TOKEN_URL = "https://accounts.spotify.com/api/token"
+# (connect, read) seconds. generate() waits on check_spotify however long it takes
+API_TIMEOUT = (3.05, 10)
 
 
 def spotify_env():
@@ -37,7 +39,9 @@ def get_access_token() -> str:
         headers = {
             "Authorization": f"Basic {auth_header}",
         }
-        response = requests.post(TOKEN_URL, headers=headers, data=request_data)
+        response = requests.post(
+            TOKEN_URL, headers=headers, data=request_data, timeout=API_TIMEOUT
+        )
         response.raise_for_status()
         token.access_token = response.json()["access_token"]
         token.expires_in = response.json()["expires_in"]
@@ -50,7 +54,9 @@ def now_playing():
     headers = {
         "Authorization": f"Bearer {access_token}",
     }
-    response = requests.get("https://api.spotify.com/v1/me/player", headers=headers)
+    response = requests.get(
+        "https://api.spotify.com/v1/me/player", headers=headers, timeout=API_TIMEOUT
+    )
     response.raise_for_status()
     if not response.text.strip():
         return
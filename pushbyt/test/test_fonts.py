@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase
+from datetime import datetime, timedelta
+from itertools import islice
+from pushbyt.animation import fonts
+from pushbyt.animation.radar import clock_radar
+from pushbyt.animation.rays2 import clock_rays
+from pushbyt.animation.timer import timer
+from pushbyt.benchmarks.baselines import clock_frames
+
+
+class FontRegistryTestCase(SimpleTestCase):
+    def test_loads_each_font_once(self):
+        registry = fonts.FontRegistry()
+        font = registry.get("./fonts/pixelmix/pixelmix.ttf", 8)
+        self.assertIs(registry.get(*fonts.PIXELMIX), font)
+        self.assertIsNot(registry.get("fonts/pixelmix/pixelmix.ttf", 9), font)
+        self.assertEqual(registry.loads, 2)
+        self.assertGreater(registry.load_time, 0)
+
+    def test_render_path_does_not_load_fonts(self):
+        fonts.preload_fonts()
+        loads = fonts.registry.loads
+        clock_frames(clock_radar(datetime(2024, 1, 1, 10, 59, 50)), 20)
+        clock_frames(clock_rays(), 20)
+        list(islice(timer(timedelta(minutes=1)), 20))
+        self.assertEqual(fonts.registry.loads, loads)
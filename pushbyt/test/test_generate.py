@@ -1,13 +1,49 @@
-from django.test import TestCase
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
+from importlib import import_module
+from unittest import mock
+from pathlib import Path
+from PIL import Image
+from ha.models import Timer
 from pushbyt.models import Animation
-from pushbyt.animation.generate import get_segment_start
+from pushbyt.animation import FRAME_TIME
+from pushbyt.animation.clip_cache import ClipCache
+from pushbyt.animation.generate import ANIM_STEP, get_segment_start, iter_windows
+from pushbyt.views.generate import generate as generate_view
 import logging
+import json
+import os
+import random
+import tempfile
+import threading
+import time
 
 # Disable logging during tests
 logging.disable(logging.CRITICAL)
 
+# pushbyt.animation re-exports generate(), which shadows the module name
+generate_module = import_module("pushbyt.animation.generate")
+
+
+class GenerateModuleMixin:
+    """Renders into a temporary RENDER_DIR, and patches the generate module."""
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.render_dir = Path(temp_dir.name)
+        self.patch_generate(RENDER_DIR=self.render_dir)
+
+    def patch_generate(self, **attrs):
+        """Replace generate module attributes for the rest of the test."""
+        for name, value in attrs.items():
+            patcher = mock.patch.object(generate_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
 
 class GenerationTestCase(TestCase):
     """Tests for the animation generation logic."""
@@ -121,3 +157,348 @@ class GenerationTestCase(TestCase):
 
         # The returned time should be properly aligned (seconds should be 0, 12, 24, 36, 48)
         self.assertIn(start_time.second, [0, 12, 24, 36, 48])
+
+
+class ConcurrentChecksTestCase(SimpleTestCase):
+    """Tests for running the generation checks concurrently."""
+
+    def test_checks_are_isolated(self):
+        """A failing or slow check doesn't affect the others."""
+        release = threading.Event()
+
+        def check_spotify():
+            raise RuntimeError("Spotify auth expired")
+
+        def check_timer(_):
+            release.wait(5)
+            return "Timer done"
+
+        def generate_clock(_):
+            return "Clock done"
+
+        overrun = threading.Timer(0.4, release.set)
+        overrun.start()
+        with (
+            mock.patch.object(generate_module, "check_spotify", check_spotify),
+            mock.patch.object(generate_module, "check_timer", check_timer),
+            mock.patch.object(generate_module, "generate_clock", generate_clock),
+            mock.patch.object(generate_module, "RENDER_BUDGET", timedelta(seconds=0.2)),
+        ):
+            result = generate_module.generate()
+        overrun.cancel()
+
+        self.assertEqual(
+            result.split("\n"),
+            [
+                "check_spotify failed",
+                "check_timer took longer than 0:00:00.200000: Timer done",
+                "Clock done",
+            ],
+        )
+
+
+class GenerateLockTestCase(GenerateModuleMixin, TransactionTestCase):
+    """Tests for the generate view's lock around an overrunning check."""
+
+    def test_overrunning_check_holds_lock(self):
+        """A second request is turned away until a slow check has finished."""
+        started, release = threading.Event(), threading.Event()
+
+        def check_timer(_):
+            started.set()
+            release.wait(5)
+            return "Timer done"
+
+        self.patch_generate(
+            check_spotify=lambda: "Spotify not playing",
+            check_timer=check_timer,
+            generate_clock=lambda _: "Clock done",
+            RENDER_BUDGET=timedelta(seconds=0.1),
+        )
+        Animation.objects.create(served_at=timezone.now())
+        responses = []
+
+        def first_request():
+            try:
+                responses.append(generate_view(None))
+            finally:
+                connections.close_all()
+
+        first = threading.Thread(target=first_request)
+        first.start()
+        self.assertTrue(started.wait(5))
+        # Well past the check's budget, so it's overrunning
+        time.sleep(0.3)
+        second = generate_view(None)
+        release.set()
+        first.join(5)
+
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertIn(
+            "check_timer took longer than 0:00:00.100000: Timer done",
+            responses[0].content.decode(),
+        )
+
+
+class WindowSlicingTestCase(SimpleTestCase):
+    """Tests for streaming frames into overlapping animation windows."""
+
+    def test_iter_windows(self):
+        """Windows overlap, start every step and only include complete ones."""
+        start = timezone.now()
+        timed_frames = (
+            (i, start + timedelta(milliseconds=100 * i)) for i in range(1050)
+        )
+        windows = list(iter_windows(timed_frames))
+
+        self.assertEqual(len(windows), 8)
+        for n, (window_start, frames) in enumerate(windows):
+            self.assertEqual(frames, list(range(n * 120, n * 120 + 150)))
+            self.assertEqual(window_start, start + timedelta(seconds=n * 12))
+
+    def test_iter_windows_is_lazy(self):
+        """The first window is emitted before the rest of the stream exists."""
+
+        def timed_frames():
+            for i in range(150):
+                yield i, timezone.now()
+            raise AssertionError("Pulled past the first window")
+
+        _, frames = next(iter_windows(timed_frames()))
+        self.assertEqual(len(frames), 150)
+
+
+class TimerClipCacheTestCase(GenerateModuleMixin, TestCase):
+    """Timer clips are reused across segments and timer restarts."""
+
+    def setUp(self):
+        super().setUp()
+        self.clips = ClipCache(self.render_dir / "cache" / "timer")
+        self.patch_generate(TIMER_CLIPS=self.clips)
+
+    def start_timer(self, created_at):
+        timer = Timer.objects.create(duration=timedelta(minutes=5))
+        Timer.objects.filter(pk=timer.pk).update(created_at=created_at)
+        timer.refresh_from_db()
+        return timer
+
+    def test_restarted_timer_reuses_clips(self):
+        start = Animation.align_time(timezone.now())
+        created_at = start - timedelta(seconds=20, microseconds=30000)
+        generate_module.generate_timer(start, self.start_timer(created_at))
+        first = [Path(a.file_path).read_bytes() for a in Animation.objects.all()]
+        self.assertEqual((self.clips.hits, self.clips.misses), (0, len(first)))
+
+        # The same timer a day later, started a few milliseconds off
+        day = timedelta(days=1)
+        timer = self.start_timer(created_at + day + timedelta(microseconds=20000))
+        result = generate_module.generate_timer(start + day, timer)
+        self.assertIn(f"{len(first)} reused", result)
+        self.assertEqual(self.clips.hits, len(first))
+
+        again = Animation.objects.filter(start_time__gte=start + day)
+        self.assertEqual([Path(a.file_path).read_bytes() for a in again], first)
+
+    def test_clip_key(self):
+        key = generate_module.timer_clip_key
+        self.assertEqual(
+            key(timedelta(seconds=5.03), 150), key(timedelta(seconds=5.07), 150)
+        )
+        self.assertNotEqual(
+            key(timedelta(seconds=5), 150), key(timedelta(seconds=5.03), 150)
+        )
+        self.assertNotEqual(
+            key(timedelta(seconds=5.03), 150), key(timedelta(seconds=5.03), 120)
+        )
+        with mock.patch.object(generate_module, "TIMER_VERSION", 2):
+            bumped = key(timedelta(seconds=5.03), 150)
+        self.assertNotEqual(key(timedelta(seconds=5.03), 150), bumped)
+
+    def test_eviction_keeps_linked_files(self):
+        clips = ClipCache(self.render_dir / "clips", max_files=2)
+        paths = []
+        for i in range(3):
+            path = self.render_dir / f"clip{i}.webp"
+            path.write_bytes(b"clip %d" % i)
+            clips.store(f"key {i}", path)
+            os.utime(clips.path(f"key {i}"), (i, i))
+            paths.append(path)
+        clips.evict()
+
+        self.assertFalse(clips.fetch("key 0", self.render_dir / "out.webp"))
+        self.assertTrue(clips.fetch("key 2", self.render_dir / "out.webp"))
+        self.assertEqual((self.render_dir / "out.webp").read_bytes(), b"clip 2")
+        self.assertEqual(paths[0].read_bytes(), b"clip 0")
+
+    def test_eviction_by_age(self):
+        clips = ClipCache(self.render_dir / "clips", max_age=timedelta(days=1))
+        for key in ["old", "new"]:
+            path = self.render_dir / f"{key}.webp"
+            path.write_bytes(key.encode())
+            clips.store(key, path)
+        os.utime(clips.path("old"), (0, 0))
+        clips.evict()
+
+        self.assertFalse(clips.path("old").exists())
+        self.assertTrue(clips.path("new").exists())
+
+    def test_eviction_under_cap_skips_scan(self):
+        clips = ClipCache(self.render_dir / "clips", max_files=2)
+        path = self.render_dir / "clip.webp"
+        path.write_bytes(b"clip")
+        clips.store("key", path)
+        stat = Path.stat
+
+        def directory_stat(path, **kwargs):
+            self.assertNotEqual(path.suffix, ".webp", "Stat an entry under the cap")
+            return stat(path, **kwargs)
+
+        with mock.patch.object(Path, "stat", directory_stat):
+            clips.evict()
+
+        self.assertTrue(clips.path("key").exists())
+
+    def test_eviction_tolerates_vanished_entries(self):
+        clips = ClipCache(self.render_dir / "clips", max_files=1)
+        for i in range(3):
+            path = self.render_dir / f"clip{i}.webp"
+            path.write_bytes(b"clip %d" % i)
+            clips.store(f"key {i}", path)
+            os.utime(clips.path(f"key {i}"), (i, i))
+        vanished = clips.path("key 0")
+        stat = Path.stat
+
+        def racing_stat(path, **kwargs):
+            if path == vanished:
+                raise FileNotFoundError(path)
+            return stat(path, **kwargs)
+
+        with mock.patch.object(Path, "stat", racing_stat):
+            clips.evict()
+
+        self.assertFalse(clips.path("key 1").exists())
+        self.assertTrue(clips.path("key 2").exists())
+
+
+class SpotifyRenderCacheTestCase(GenerateModuleMixin, TestCase):
+    """A track that comes back is served from its earlier render."""
+
+    def setUp(self):
+        super().setUp()
+        self.renders = ClipCache(self.render_dir / "cache" / "spotify")
+        self.song_info = mock.Mock(side_effect=lambda *args: iter(self.frames()))
+        self.playing = None
+        self.patch_generate(
+            SPOTIFY_RENDERS=self.renders,
+            song_info=self.song_info,
+            now_playing=lambda: self.playing,
+        )
+
+    def frames(self):
+        return [Image.new("RGB", (64, 32), (i, 0, 0)) for i in range(3)]
+
+    def play(self, track_id):
+        self.playing = {
+            "id": track_id,
+            "title": f"Song {track_id}",
+            "artist": "Artist",
+            "art": f"https://example.com/{track_id}.jpg",
+        }
+        return generate_module.check_spotify()
+
+    def test_returning_track_is_not_rendered_again(self):
+        self.play("a")
+        first = Path(Animation.objects.latest("created_at").file_path).read_bytes()
+        self.play("b")
+        result = self.play("a")
+
+        self.assertIn("reused", result)
+        self.assertEqual(self.song_info.call_count, 2)
+        self.assertEqual((self.renders.hits, self.renders.misses), (1, 2))
+        anim = Animation.objects.latest("created_at")
+        self.assertEqual(anim.metadata, {"id": "a", "reused": True})
+        self.assertEqual(Path(anim.file_path).read_bytes(), first)
+
+    def test_new_renderer_version_renders_again(self):
+        self.play("a")
+        self.play("b")
+        with mock.patch.object(generate_module, "SONG_VERSION", 2):
+            result = self.play("a")
+
+        self.assertIn("rendered", result)
+        self.assertEqual(self.song_info.call_count, 3)
+
+
+class ClockSeedTestCase(GenerateModuleMixin, TestCase):
+    """Clock segments render to the same bytes from the same seed."""
+
+    def render(self, start, source, seed):
+        renderer = generate_module.clock_renderer(source, start, random.Random(seed))
+        timed_frames = generate_module.generate_clock_frames(
+            start, generate_module.ANIM_DURATION, renderer
+        )
+        animations = generate_module.slice_into_animations(
+            timed_frames, source, metadata={"seed": seed}
+        )
+        return [(a.metadata, Path(a.file_path).read_bytes()) for a in animations]
+
+    def test_rerender_is_identical(self):
+        start = Animation.align_time(timezone.now())
+        seed = generate_module.segment_seed(start)
+        for source in generate_module.CLOCK_SOURCES:
+            with self.subTest(source):
+                first = self.render(start, source, seed)
+                self.assertEqual([metadata for metadata, _ in first], [{"seed": seed}])
+                self.assertEqual(self.render(start, source, seed), first)
+                self.assertNotEqual(self.render(start, source, seed + 1), first)
+
+
+class ClockResumeTestCase(GenerateModuleMixin, TestCase):
+    """A clock segment carries on from the renderer state the last one left."""
+
+    def test_restored_renderer_continues_exactly(self):
+        start = Animation.align_time(timezone.now())
+        times = [start + i * FRAME_TIME for i in range(60)]
+        for source in generate_module.CLOCK_SOURCES:
+            with self.subTest(source):
+                rng = random.Random(1)
+                renderer = generate_module.clock_renderer(source, start, rng)
+                for t in times[:30]:
+                    renderer.render_frame(t)
+                snapshot = json.loads(json.dumps(renderer.snapshot()))
+
+                resumed_rng = random.Random()
+                resumed = generate_module.clock_renderer(source, times[30], resumed_rng)
+                resumed.restore(snapshot)
+                # Continue the same random sequence to compare frame by frame
+                resumed_rng.setstate(rng.getstate())
+                for t in times[30:]:
+                    self.assertEqual(
+                        resumed.render_frame(t).tobytes(),
+                        renderer.render_frame(t).tobytes(),
+                    )
+
+    def test_next_segment_resumes(self):
+        # Long past, so there's never enough coverage
+        start = timezone.make_aware(datetime(2024, 1, 1, 10, 0))
+        self.patch_generate(SEGMENT_TIME=timedelta(seconds=12))
+        for source in generate_module.CLOCK_SOURCES:
+            with (
+                self.subTest(source),
+                mock.patch.object(generate_module, "CLOCK_SOURCES", [source]),
+            ):
+                Animation.objects.all().delete()
+                self.assertIn("fresh", generate_module.generate_clock(start))
+                last = Animation.objects.latest("start_time")
+                snapshot_time = datetime.fromisoformat(
+                    last.metadata["snapshot"]["time"]
+                )
+                self.assertEqual(snapshot_time, last.start_time + ANIM_STEP)
+
+                self.assertNotIn("resumed_from", last.metadata)
+
+                self.assertIn("resumed", generate_module.generate_clock(start))
+                first = Animation.objects.get(start_time=snapshot_time)
+                self.assertNotIn("snapshot", first.metadata)
+                self.assertEqual(first.metadata["resumed_from"], last.pk)
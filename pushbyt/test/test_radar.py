@@ -0,0 +1,107 @@
+from django.test import SimpleTestCase
+from pushbyt.animation import FRAME_TIME
+from PIL import ImageChops
+from datetime import datetime, timedelta
+from pushbyt.animation import fonts, radar, rays2
+from pushbyt.benchmarks.baselines import (
+    baseline_background,
+    baseline_clock_rays,
+    baseline_compose_time_img,
+    baseline_time_pixels,
+    baseline_transform_ray,
+    clock_frames,
+    radar_frames,
+    ray_sweep,
+)
+import numpy as np
+import random
+
+
+class RadarTestCase(SimpleTestCase):
+    """The vectorized radar rendering must match the per-pixel versions."""
+
+    def assertSameImage(self, actual, expected):
+        self.assertEqual(actual.mode, expected.mode)
+        self.assertIsNone(ImageChops.difference(actual, expected).getbbox())
+
+    def test_background_matches_baseline(self):
+        background = radar.Background(random.Random(1))
+        for _ in range(200):
+            image = background.render_frame()
+            self.assertSameImage(image, baseline_background(background))
+
+    def test_masks_are_shared_across_sweeps(self):
+        """Angles a full sweep apart reuse the same cached ray mask."""
+        first = radar.get_ray_image(radar.datetime_to_radian(timedelta(seconds=1), 9))
+        again = radar.get_ray_image(radar.datetime_to_radian(timedelta(seconds=10), 9))
+        self.assertIs(first, again)
+
+        fresh = radar.ray_mask.__wrapped__(0, 0)
+        self.assertSameImage(radar.ray_mask(0, 0), fresh)
+
+    def test_transform_ray_matches_baseline(self):
+        for ray_image, time_image in ray_sweep():
+            self.assertSameImage(
+                radar.transform_ray(ray_image, time_image),
+                baseline_transform_ray(ray_image, time_image),
+            )
+
+    def test_particles_match_baseline(self):
+        """Array-backed trails and digits render the same frames."""
+        for frame, expected in zip(radar_frames(300), radar_frames(300, True)):
+            self.assertSameImage(frame, expected)
+
+
+class TimeTextTestCase(SimpleTestCase):
+    """Clock digits are rasterized once per minute and match the old layout."""
+
+    def setUp(self):
+        self.font = fonts.get_font(*fonts.DEPARTURE_MONO)
+        self.atlas = fonts.get_atlas(*fonts.DEPARTURE_MONO)
+        radar.time_img.cache_clear()
+        rays2.get_time_pixels.cache_clear()
+
+    def test_matches_baseline(self):
+        for hour, minute in [(1, 0), (10, 7), (12, 59), (7, 41)]:
+            t = datetime(2024, 1, 1, hour, minute)
+            self.assertIsNone(
+                ImageChops.difference(
+                    radar.compose_time_img(self.atlas, t),
+                    baseline_compose_time_img(self.font, t),
+                ).getbbox()
+            )
+            time_str = t.strftime("%-I:%M")
+            self.assertEqual(
+                list(rays2.get_time_pixels(time_str)), baseline_time_pixels(time_str)
+            )
+
+    def test_segment_rasterizes_twice(self):
+        start = datetime(2024, 1, 1, 10, 59, 20)
+        for i in range(900):
+            t = start + FRAME_TIME * i
+            radar.compose_time_img(self.atlas, t)
+            rays2.get_time_pixels(t.strftime("%-I:%M"))
+        self.assertEqual(radar.time_img.cache_info().misses, 2)
+        self.assertEqual(rays2.get_time_pixels.cache_info().misses, 2)
+
+
+class RaysTestCase(SimpleTestCase):
+    """Rays are drawn natively now, so they only need to look the same."""
+
+    def test_frames_look_like_baseline(self):
+        frames = clock_frames(rays2.clock_rays(random.Random(5)))
+        expected = clock_frames(baseline_clock_rays(random.Random(5)))
+        for frame, baseline in zip(frames, expected, strict=True):
+            frame, baseline = np.asarray(frame, int), np.asarray(baseline, int)
+            self.assertLess(np.abs(frame - baseline).mean(), 8)
+            self.assertAlmostEqual(frame.mean(), baseline.mean(), delta=4)
+
+    def test_rays_leave_the_screen(self):
+        rays = rays2.RayField()
+        rays.add([0.0, np.pi / 2])
+        for _ in range(7):
+            rays.animate()
+            rays.prune()
+        # Seven steps out is off the top but not the side of a wide screen
+        self.assertEqual(rays.angle.tolist(), [0.0])
+        self.assertEqual(rays.color.tolist(), [[185, 150, 220]])
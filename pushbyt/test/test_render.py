@@ -0,0 +1,174 @@
+from django.test import SimpleTestCase
+from concurrent.futures import Future
+from io import BytesIO
+from unittest import mock
+from pathlib import Path
+from PIL import Image, ImageChops
+from pushbyt.animation import util, webp
+import tempfile
+
+
+WIDTH, HEIGHT = 64, 32
+
+
+def solid_frames(*colors):
+    return [Image.new("RGB", (WIDTH, HEIGHT), color) for color in colors]
+
+
+def frame_rects(data):
+    """(x, y, width, height) of every ANMF chunk in an animation."""
+    rects = []
+    for fourcc, payload in webp.iter_chunks(data):
+        if fourcc == b"ANMF":
+            x, y, w, h = [
+                int.from_bytes(payload[i : i + 3], "little") for i in range(0, 12, 3)
+            ]
+            rects.append((x * 2, y * 2, w + 1, h + 1))
+    return rects
+
+
+def decode(data):
+    image = Image.open(BytesIO(data))
+    frames = []
+    for i in range(image.n_frames):
+        image.seek(i)
+        image.load()
+        frames.append((image.convert("RGB"), image.info["duration"]))
+    return image, frames
+
+
+class RenderTestCase(SimpleTestCase):
+    """Tests for the in-process animated WebP encoder."""
+
+    def test_encode_matches_frames(self):
+        """Each muxed frame decodes to the same pixels as its still encoding."""
+        frames = solid_frames("red", "green", "blue")
+        image, decoded = decode(util.encode(frames))
+
+        self.assertEqual(image.info["loop"], 1)
+        self.assertEqual(image.info["background"], (255, 255, 255, 255))
+        self.assertEqual(len(decoded), len(frames))
+        for i, (frame, (decoded_frame, duration)) in enumerate(zip(frames, decoded)):
+            still = Image.open(BytesIO(util.encode_frame(i, frame))).convert("RGB")
+            self.assertIsNone(ImageChops.difference(decoded_frame, still).getbbox())
+            self.assertEqual(duration, util.FRAME_MS)
+
+    def test_render_writes_file(self):
+        """render() writes the encoded animation and reports empty input."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir) / "anim.webp"
+            self.assertFalse(util.render([], file_path, encoder="mux"))
+            self.assertFalse(file_path.exists())
+            self.assertTrue(util.render(solid_frames("red"), file_path))
+            self.assertEqual(file_path.read_bytes()[8:12], b"WEBP")
+
+    def test_unknown_encoder(self):
+        with self.assertRaises(ValueError):
+            util.render(solid_frames("red"), "unused.webp", encoder="gif")
+
+    def test_frame_cache_reuses_encoded_frames(self):
+        """Frames shared by overlapping clips are only encoded once."""
+        frames = solid_frames("red", "green", "blue", "white")
+        cache = util.FrameCache()
+        first = util.encode(frames[:3], cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        util.encode(frames[1:], cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        self.assertEqual(cache.hit_rate, 2 / 6)
+        self.assertEqual(first, util.encode(frames[:3]))
+
+    def test_identical_frames_are_collapsed(self):
+        """Runs of identical frames become one frame with a longer duration."""
+        frames = solid_frames("red", "red", "red", "blue", "red")
+        _, decoded = decode(util.encode(frames))
+        durations = [duration for _, duration in decoded]
+        self.assertEqual(durations, [300, 100, 100])
+        self.assertEqual(sum(durations), len(frames) * util.FRAME_MS)
+
+    def test_partial_frames(self):
+        """Frames after a keyframe only carry the rectangle that changed."""
+        frames = solid_frames("black", "black", "black")
+        frames[1].paste((255, 255, 255), (11, 5, 15, 9))
+        frames[2].paste((255, 255, 255), (11, 5, 15, 9))
+        frames[2].paste((255, 0, 0), (40, 20, 42, 22))
+
+        rects = frame_rects(util.encode(frames, keyframe_interval=10))
+        self.assertEqual(rects, [(0, 0, 64, 32), (10, 4, 5, 5), (40, 20, 2, 2)])
+
+        rects = frame_rects(util.encode(frames, keyframe_interval=2))
+        self.assertEqual(rects, [(0, 0, 64, 32), (10, 4, 5, 5), (0, 0, 64, 32)])
+
+        _, decoded = decode(util.encode(frames, keyframe_interval=10))
+        center = decoded[2][0].getpixel((12, 6))
+        self.assertTrue(all(c > 240 for c in center))
+
+    def test_alpha_flag_only_for_transparent_frames(self):
+        """VP8X only claims alpha when a frame actually has some."""
+        for mode, color, has_alpha in [
+            ("RGB", "red", False),
+            ("RGBA", (255, 0, 0, 255), False),
+            ("RGBA", (255, 0, 0, 0), True),
+        ]:
+            with self.subTest(mode=mode, color=color):
+                still = BytesIO()
+                Image.new(mode, (WIDTH, HEIGHT), color).save(
+                    still, "WebP", lossless=True
+                )
+                frame = webp.Frame(still.getvalue(), WIDTH, HEIGHT, util.FRAME_MS)
+                data = webp.assemble([frame], (WIDTH, HEIGHT))
+                fourcc, vp8x = next(webp.iter_chunks(data))
+                self.assertEqual(fourcc, b"VP8X")
+                self.assertEqual(bool(vp8x[0] & webp.ALPHA_FLAG), has_alpha)
+
+    def test_large_changes_stay_full_frames(self):
+        """A change over most of the frame isn't worth cropping."""
+        frames = solid_frames("black", "black", "black")
+        for frame in frames[1:]:
+            frame.paste((255, 255, 255), (0, 0, 60, 30))
+        frames[2].paste((255, 0, 0), (40, 20, 44, 24))
+
+        rects = frame_rects(util.encode(frames, keyframe_interval=10))
+        self.assertEqual(rects, [(0, 0, 64, 32), (0, 0, 64, 32), (40, 20, 4, 4)])
+
+    def test_cancelled_frames_are_encoded_serially(self):
+        """A frame whose pool future was cancelled is still encoded."""
+        frame = solid_frames("red")[0]
+        key = util.frame_key(frame)
+        cache = util.FrameCache()
+        future = Future()
+        future.cancel()
+        cache.pending[key] = future, 0
+        self.assertEqual(cache.encode(0, frame, key), util.encode_frame(0, frame))
+
+    @mock.patch.object(util, "RENDER_WORKERS", 2)
+    def test_render_all_survives_a_discarded_pool(self):
+        """A pool shut down by another render falls back to serial encoding."""
+        frames = solid_frames("red", "green", "blue")
+        pool = util.ProcessPoolExecutor(1)
+        pool.shutdown()
+        with (
+            tempfile.TemporaryDirectory() as temp_dir,
+            mock.patch.object(util, "encoding_pool", return_value=pool),
+        ):
+            clips = [(frames, Path(temp_dir) / "clip.webp")]
+            self.assertEqual(util.render_all(clips, workers=2), [True])
+
+    @mock.patch.object(util, "RENDER_WORKERS", 2)
+    def test_render_all_parallel_matches_serial(self):
+        """Encoding slices in worker processes gives the same files."""
+        frames = solid_frames("red", "green", "blue", "white", "black")
+        self.assertIs(util.encoding_pool(), util.encoding_pool())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            outputs = []
+            for workers in [1, 2]:
+                clips = [
+                    (frames[i : i + 3], Path(temp_dir) / f"{workers}-{i}.webp")
+                    for i in range(0, 3, 2)
+                ]
+                cache = util.FrameCache()
+                self.assertEqual(
+                    util.render_all(clips, cache=cache, workers=workers), [True, True]
+                )
+                self.assertEqual((cache.hits, cache.misses), (1, 5))
+                outputs.append([file_path.read_bytes() for _, file_path in clips])
+            self.assertEqual(outputs[0], outputs[1])
@@ -0,0 +1,105 @@
+from django.test import SimpleTestCase
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+from PIL import ImageChops
+from unittest import mock
+from pushbyt.animation import song
+from pushbyt.animation.art_cache import ArtCache
+from pushbyt.animation.fonts import get_atlas, PIXELMIX
+from pushbyt.benchmarks.baselines import (
+    baseline_dominant_color,
+    baseline_gen_album_art,
+    baseline_song_frames,
+    baseline_screen_img,
+    sample_art,
+    sample_covers,
+    screen_inputs,
+)
+import os
+import tempfile
+from pushbyt.benchmarks.tracks import TRACKS
+
+
+class SongTestCase(SimpleTestCase):
+    def assertSameImage(self, actual, expected):
+        self.assertEqual(actual.mode, expected.mode)
+        self.assertIsNone(ImageChops.difference(actual, expected).getbbox())
+
+    def test_screen_img_matches_baseline(self):
+        for track in TRACKS:
+            for args in screen_inputs(track):
+                self.assertSameImage(song.screen_img(*args), baseline_screen_img(*args))
+
+    def test_album_art_matches_baseline(self):
+        art = sample_art()
+        # Long enough for the scroll and the border to both wrap around
+        count = 3 * (song.ART_HEIGHT + song.BORDER_HEIGHT)
+        frames = islice(song.gen_album_art(art), count)
+        expected = islice(baseline_gen_album_art(art), count)
+        for frame, baseline in zip(frames, expected, strict=True):
+            self.assertSameImage(frame, baseline)
+
+    def test_song_frames_match_baseline(self):
+        art = sample_art()
+        for track in TRACKS:
+            args = (track["title"], track["artist"], art)
+            frames = list(song.song_frames(*args))
+            expected = list(baseline_song_frames(*args))
+            self.assertEqual(len(frames), len(expected))
+            for frame, baseline in zip(frames, expected):
+                self.assertSameImage(frame, baseline)
+
+    def test_text_layers_are_cached(self):
+        atlas = get_atlas(*PIXELMIX)
+        song.text_layer.cache_clear()
+        for _ in range(2):
+            list(song.gen_text("Some title", atlas, 50))
+            list(song.gen_text_masks("Some title", atlas, 50))
+        self.assertEqual(song.text_layer.cache_info().misses, 1)
+
+    def test_dominant_color_matches_baseline(self):
+        for name, cover in sample_covers().items():
+            with self.subTest(name):
+                self.assertEqual(
+                    song.get_dominant_color(cover), baseline_dominant_color(cover)
+                )
+
+
+class ArtCacheTestCase(SimpleTestCase):
+    URL = "https://i.scdn.co/image/cover"
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = Path(temp_dir.name)
+        cover = BytesIO()
+        sample_art().save(cover, "JPEG")
+        response = mock.Mock(content=cover.getvalue())
+        self.get = mock.patch.object(song.SESSION, "get", return_value=response)
+        self.get.start()
+        self.addCleanup(self.get.stop)
+
+    def load_art(self):
+        """Load the art as a freshly started process would."""
+        with mock.patch.object(song, "ART_CACHE", ArtCache(self.directory)):
+            return song.load_art(self.URL)
+
+    def test_art_is_fetched_once(self):
+        art, color = self.load_art()
+        self.assertEqual(art.size, (64, 64))
+        self.assertEqual(color, song.get_dominant_color(art))
+
+        cached_art, cached_color = self.load_art()
+        self.assertEqual(song.SESSION.get.call_count, 1)
+        self.assertEqual(cached_color, color)
+        self.assertIsNone(ImageChops.difference(cached_art, art).getbbox())
+
+    def test_eviction(self):
+        cache = ArtCache(self.directory, max_files=2)
+        for i in range(3):
+            cache.store(f"{self.URL}{i}", sample_art(), (i, i, i))
+            os.utime(cache.path(f"{self.URL}{i}"), (i, i))
+        self.assertIsNone(cache.fetch(f"{self.URL}0"))
+        self.assertEqual(cache.fetch(f"{self.URL}2")[1], (2, 2, 2))
+        self.assertEqual(str(cache), "art cache 1/2 hits (50%)")
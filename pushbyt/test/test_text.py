@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+from PIL import Image, ImageChops, ImageDraw
+from pushbyt.animation import fonts
+from pushbyt.animation.text import GlyphAtlas
+import random
+import string
+
+
+class GlyphAtlasTestCase(SimpleTestCase):
+    """Blitted text must match what FreeType draws for every pixel font."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.texts = ["", " ", "1", " 7", "10:59", "Too Much", "g'j y"] + [
+            "".join(
+                rng.choice(string.printable[:95]) for _ in range(rng.randint(1, 12))
+            )
+            for _ in range(40)
+        ]
+
+    def test_matches_freetype(self):
+        for spec in fonts.ALL_FONTS:
+            font = fonts.get_font(*spec)
+            atlas = GlyphAtlas(font)
+            for text in self.texts:
+                for anchor in ["la", "mt", "rs"]:
+                    self.assertEqual(
+                        atlas.bbox(text, anchor), font.getbbox(text, anchor=anchor)
+                    )
+                    for xy in [(0, 0), (32, 1), (-3, 12.0)]:
+                        expected = Image.new("RGB", (64, 40))
+                        ImageDraw.Draw(expected).text(
+                            xy, text, fill=(255, 50, 50), font=font, anchor=anchor
+                        )
+                        actual = Image.new("RGB", (64, 40))
+                        atlas.draw(actual, xy, text, (255, 50, 50), anchor)
+                        diff = ImageChops.difference(actual, expected)
+                        self.assertIsNone(diff.getbbox(), (spec, text, anchor, xy))
+
+    def test_unsupported_anchor(self):
+        atlas = fonts.get_atlas(*fonts.PIXELMIX)
+        with self.assertRaises(ValueError):
+            atlas.bbox("Brandy", "mm")
@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase
+from PIL import ImageChops
+from datetime import timedelta
+from itertools import islice
+from pushbyt.animation.timer import timer
+from pushbyt.benchmarks.baselines import baseline_timer
+
+
+class TimerTestCase(SimpleTestCase):
+    def test_matches_baseline(self):
+        """Frames from the transition atlas match rendering every digit."""
+        for delta in [timedelta(minutes=10, seconds=1), timedelta(seconds=12)]:
+            frames = islice(timer(delta), 250)
+            expected = islice(baseline_timer(delta), 250)
+            for i, (frame, expected_frame) in enumerate(zip(frames, expected)):
+                diff = ImageChops.difference(frame, expected_frame)
+                self.assertIsNone(diff.getbbox(), f"{delta} frame {i}")
@@ -9,7 +9,11 @@ logger = logging.getLogger(__name__)
 
 
 def cleanup(_):
-    command = "find render -type f -cmin +240 -delete -print | wc -l"
+    # render/cache holds clips reused across days, which manage their own size
+    command = (
+        "find render -path render/cache -prune -o "
+        + "-type f -cmin +240 -delete -print | wc -l"
+    )
     four_hours_ago = timezone.now() - timedelta(hours=4)
     try:
         output = subprocess.check_output(command, shell=True, text=True)
@@ -67,7 +67,9 @@ def choose_anim(anims, now: datetime):
     for anim in filtered_anims:
         sa = time_str(anim.served_at)
         st = time_str(anim.start_time)
-        logger.info(f"A {anim.source} {anim.pk} {sa} {st} {anim.metadata}")
+        # Leave out the renderer snapshot a clock segment's last clip carries
+        metadata = {k: v for k, v in anim.metadata.items() if k != "snapshot"}
+        logger.info(f"A {anim.source} {anim.pk} {sa} {st} {metadata}")
 
     return filtered_anims[0]
 